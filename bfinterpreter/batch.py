@@ -0,0 +1,108 @@
+# Brainfuck Batch Runner
+# Runs one program over many inputs on a process pool.  The program is compiled
+# once per worker process and inputs are sent to the workers in chunks; results
+# come back in input order.
+#
+# Usage: python -m bfinterpreter.batch [options] FILE [INPUTS]
+#   Runs FILE once per line of INPUTS (stdin if not given) and prints one JSON
+#   object with the output, steps and error of each run per line.
+
+import argparse
+import io
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional, Union
+try:
+    import bfinterpreter.brainfuck as bf
+    from bfinterpreter.limits import ExecutionLimitExceeded
+    from bfinterpreter.streams import BufferedInput
+except ModuleNotFoundError:
+    import brainfuck as bf
+    from limits import ExecutionLimitExceeded
+    from streams import BufferedInput
+
+
+@dataclass
+class BatchResult:
+    output: Union[str, bytes]
+    num_steps: Optional[int]
+    error: Optional[str] = None
+
+
+# The program prepared by each worker process (or by run_batch() itself when running in-process)
+_worker = None
+
+
+def run_batch(code, inputs, engine="optimized", workers=None, chunksize=None, eof=None, max_steps=None, timeout=None) -> List[BatchResult]:
+    """
+    Runs the code once per input and returns a BatchResult per input, in input order.
+    Inputs are str or bytes; the output of each run has the same type as its input.
+    workers is the number of processes (os.cpu_count() if None); with workers=1 the batch runs in this process.
+    eof, max_steps and timeout apply to every run (see BufferedInput and evaluate()); a run that fails
+    records the error message, the output written so far and, if known, the steps executed.
+    """
+    inputs = list(inputs)
+    workers = workers or os.cpu_count() or 1
+    settings = (code, engine, eof, max_steps, timeout)
+
+    if workers == 1 or len(inputs) <= 1:
+        _init_worker(*settings)
+        return [_run_one(data) for data in inputs]
+
+    if chunksize is None:
+        chunksize = max(1, len(inputs) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=settings) as executor:
+        return list(executor.map(_run_one, inputs, chunksize=chunksize))
+
+
+def _init_worker(code, engine, eof, max_steps, timeout):
+    global _worker
+    _worker = (bf.prepare(code, engine=engine), eof, max_steps, timeout)
+
+
+def _run_one(data):
+    program, eof, max_steps, timeout = _worker
+    binary = isinstance(data, bytes)
+    instream = BufferedInput(io.BytesIO(data) if binary else io.StringIO(data), eof=eof)
+    outstream = io.BytesIO() if binary else io.StringIO()
+
+    try:
+        num_steps = program(instream, outstream, max_steps=max_steps, timeout=timeout)
+    except ExecutionLimitExceeded as e:
+        return BatchResult(outstream.getvalue(), e.num_steps, str(e))
+    except (RuntimeError, EOFError, ValueError) as e:
+        return BatchResult(outstream.getvalue(), None, "{}: {}".format(type(e).__name__, e))
+    return BatchResult(outstream.getvalue(), num_steps)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m bfinterpreter.batch", description="Run a brainfuck program once per input line.")
+    parser.add_argument("file", help="brainfuck program")
+    parser.add_argument("inputs", nargs="?", help="file with one input per line (default: stdin)")
+    parser.add_argument("--engine", default="optimized", help="interpreter engine (default: optimized)")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: CPU count)")
+    parser.add_argument("--chunksize", type=int, default=None, help="inputs sent to a worker at a time")
+    parser.add_argument("--eof", type=int, default=None, help="value read past the end of an input (default: error)")
+    parser.add_argument("--max-steps", type=int, default=None, help="step budget per input")
+    parser.add_argument("--timeout", type=float, default=None, help="wall-clock seconds per input")
+    args = parser.parse_args()
+
+    with open(args.file, "r") as f:
+        code = f.read()
+    if args.inputs:
+        with open(args.inputs, "r", newline="") as f:
+            lines = f.read().splitlines()
+    else:
+        lines = sys.stdin.read().splitlines()
+
+    results = run_batch(code, lines, engine=args.engine, workers=args.workers, chunksize=args.chunksize,
+                        eof=args.eof, max_steps=args.max_steps, timeout=args.timeout)
+    for result in results:
+        print(json.dumps({"output": result.output, "num_steps": result.num_steps, "error": result.error}))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,11 +4,22 @@
 #
 # Usage: ./brainfuck.py [FILE]
 
+import functools
 import sys
 try:
-    import getch
+    import bfinterpreter.compiler as compiler
+    import bfinterpreter.optimizer as optimizer
+    import bfinterpreter.codegen as codegen
+    from bfinterpreter.tape import Tape
+    from bfinterpreter.streams import open_streams
+    from bfinterpreter.limits import Limits
 except ModuleNotFoundError:
-    import bfinterpreter.getch as getch
+    import compiler
+    import optimizer
+    import codegen
+    from tape import Tape
+    from streams import open_streams
+    from limits import Limits
 
 
 def _execute(filename):
@@ -17,16 +28,60 @@ def _execute(filename):
     f.close()
 
 
-def evaluate(code, instream=None, outstream=None):
-    # Configure input reading and output writing
-    read_char_fn = instream.read if instream else getch.getch
-    read_char_args = (1,) if instream else ()
-    write_char_fn = outstream.write if outstream else sys.stdout.write
+def evaluate(code, instream=None, outstream=None, engine="optimized", tape=None, max_steps=None, timeout=None, cancel=None):
+    """
+    Runs the code and returns the number of steps (source characters) executed.
+    instream and outstream may be text or binary streams, or BufferedInput/BufferedOutput wrappers to configure
+    buffering and end-of-input; input defaults to stdin and output to stdout. Output is flushed when the run ends.
+    tape is the Tape to run on (a default growing, left-clamping Tape if not given); it holds the final cells afterwards.
+    max_steps, timeout (seconds) and cancel (an object with is_set(), e.g. threading.Event) stop the run with
+    ExecutionLimitExceeded. They are checked at loop back-edges, so a run may overshoot max_steps by one loop pass.
+    """
+    program = prepare(code, engine=engine)
+    return program(instream, outstream, tape=tape, max_steps=max_steps, timeout=timeout, cancel=cancel)
+
+
+def prepare(code, engine="optimized"):
+    """
+    Cleans and compiles the code once for the engine and returns a callable taking the same instream,
+    outstream, tape and limit arguments as evaluate() and returning num_steps, for running the code repeatedly.
+    """
+    if engine not in _ENGINES:
+        raise ValueError("Unknown engine '{}', expected one of: {}".format(engine, ', '.join(_ENGINES)))
 
     code = _cleanup(list(code))
-    bracemap = _buildbracemap(code)
+    run = _ENGINES[engine](code, _buildbracemap(code))
+
+    def program(instream=None, outstream=None, tape=None, max_steps=None, timeout=None, cancel=None):
+        input_buffer, output_buffer = open_streams(instream, outstream)
+        try:
+            return run(tape or Tape(), input_buffer.read, output_buffer.write, _limits(max_steps, timeout, cancel))
+        finally:
+            output_buffer.flush()
+
+    return program
+
+
+def compile_python(code):
+    """
+    Compiles the code to a native Python function once, see prepare().
+    """
+    return prepare(code, engine="python")
+
+
+def _limits(max_steps, timeout, cancel):
+    if max_steps is None and timeout is None and cancel is None:
+        return None
+    return Limits(max_steps=max_steps, timeout=timeout, cancel=cancel)
+
+
+def _prepare_simple(code, bracemap):
+    return functools.partial(_run_simple, code, bracemap)
 
-    cells, codeptr, cellptr, num_steps = [0], 0, 0, 0
+
+def _run_simple(code, bracemap, tape, read_byte_fn, write_byte_fn, limits):
+    cells, codeptr, cellptr, num_steps = tape.cells, 0, 0, 0
+    budget = limits.start(tape) if limits else float("inf")
 
     while codeptr < len(code):
         command = code[codeptr]
@@ -34,9 +89,11 @@ def evaluate(code, instream=None, outstream=None):
         if command == ">":
             cellptr += 1
             if cellptr == len(cells):
-                cells.append(0)
+                cellptr = tape.right(cellptr)
         if command == "<":
-            cellptr = 0 if cellptr <= 0 else cellptr - 1
+            cellptr -= 1
+            if cellptr < 0:
+                cellptr = tape.left(cellptr)
         if command == "+":
             cells[cellptr] = cells[cellptr] + 1 if cells[cellptr] < 255 else 0
         if command == "-":
@@ -45,12 +102,14 @@ def evaluate(code, instream=None, outstream=None):
         if command == "[" and cells[cellptr] == 0:
             codeptr = bracemap[codeptr]
         if command == "]" and cells[cellptr] != 0:
+            if num_steps >= budget:
+                budget = limits.check(num_steps, codeptr, cellptr)
             codeptr = bracemap[codeptr]
 
         if command == ".":
-            write_char_fn(chr(cells[cellptr]))
+            write_byte_fn(cells[cellptr])
         if command == ",":
-            cells[cellptr] = ord(read_char_fn(*read_char_args))
+            cells[cellptr] = read_byte_fn()
 
         codeptr += 1
         num_steps += 1
@@ -58,6 +117,18 @@ def evaluate(code, instream=None, outstream=None):
     return num_steps
 
 
+def _prepare_compiled(code, bracemap):
+    return functools.partial(compiler.execute, compiler.compile_program(code, bracemap))
+
+
+def _prepare_optimized(code, bracemap):
+    return functools.partial(compiler.execute, optimizer.optimize(compiler.compile_program(code, bracemap)))
+
+
+def _prepare_python(code, bracemap):
+    return codegen.compile_function(code, bracemap)
+
+
 def _cleanup(code):
     return ''.join(filter(lambda x: x in ['.', ',', '[', ']', '<', '>', '+', '-'], code))
 
@@ -75,6 +146,15 @@ def _buildbracemap(code):
     return bracemap
 
 
+# Each engine prepares a run(tape, read_byte_fn, write_byte_fn, limits) function for cleaned code
+_ENGINES = {
+    "simple": _prepare_simple,
+    "compiled": _prepare_compiled,
+    "optimized": _prepare_optimized,
+    "python": _prepare_python,
+}
+
+
 def main():
     if len(sys.argv) == 2:
         _execute(sys.argv[1])
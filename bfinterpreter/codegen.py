@@ -0,0 +1,174 @@
+# Brainfuck to Python Code Generator
+# Translates an (optimized) compiled program into Python source with native 'while'
+# loops, compiles it once and caches the code object per cleaned brainfuck source.
+#
+# The generated function has the signature run(tape, read_byte_fn, write_byte_fn, limits)
+# and returns the number of steps (source characters) executed, like the other engines.
+# Limits are checked at the end of every loop pass; an idiom that would take the steps
+# past the next check runs as its loop instead. Programs with loops nested deeper
+# than Python can compile run on the optimized engine instead.
+
+import functools
+
+try:
+    import bfinterpreter.compiler as compiler
+    import bfinterpreter.optimizer as optimizer
+except ModuleNotFoundError:
+    import compiler
+    import optimizer
+
+_CACHE_SIZE = 128
+_code_cache = {}
+# CPython compiles at most 20 statically nested loops
+_MAX_LOOPS = 20
+
+
+class _TooDeep(Exception):
+    pass
+
+
+def compile_function(code, bracemap):
+    """
+    Returns the native Python function for the cleaned code.
+    The compiled code object is cached, so repeated calls only pay for creating the function.
+    If the loops nest too deeply for Python, returns the optimized engine's run function instead.
+    """
+    code_object = _code_cache.get(code)
+    if code_object is None:
+        program = optimizer.optimize(compiler.compile_program(code, bracemap))
+        source = generate_source(program)
+        # Too deep programs are cached as their compiled program
+        code_object = program if source is None else compile(source, "<brainfuck>", "exec")
+        if len(_code_cache) >= _CACHE_SIZE:
+            del _code_cache[next(iter(_code_cache))]
+        _code_cache[code] = code_object
+
+    if isinstance(code_object, list):
+        return functools.partial(compiler.execute, code_object)
+    namespace = {"find_zero": compiler.find_zero}
+    exec(code_object, namespace)
+    return namespace["run"]
+
+
+def generate_source(program):
+    """
+    Returns the Python source of a 'run(tape, read_byte_fn, write_byte_fn, limits)' function for a compiled program,
+    or None if its loops nest too deeply to compile.
+    """
+    lines = [
+        "def run(tape, read_byte_fn, write_byte_fn, limits=None):",
+        "    c, p, steps = tape.cells, 0, 0",
+        "    left, right, reserve = tape.left, tape.right, tape.reserve",
+        "    budget = limits.start(tape) if limits else float('inf')",
+    ]
+    try:
+        _emit_block(program, 0, len(program), lines, 1, 0, compiler.source_positions(program))
+    except _TooDeep:
+        return None
+    lines.append("    return steps")
+    return "\n".join(lines) + "\n"
+
+
+def _emit_block(program, start, stop, lines, depth, loops, positions):
+    # Emits instructions program[start:stop]; steps of straight-line code are added in one go
+    indent = "    " * depth
+    pending_steps = 0
+    position = start
+
+    def flush(extra=0):
+        nonlocal pending_steps
+        if pending_steps + extra:
+            lines.append("{}steps += {}".format(indent, pending_steps + extra))
+        pending_steps = 0
+
+    while position < stop:
+        op, arg, steps = program[position]
+
+        if op == compiler.ADD:
+            if arg:
+                lines.append("{}c[p] = (c[p] + {}) & 255".format(indent, arg))
+        elif op == compiler.MOVE:
+            if arg > 0:
+                lines.append("{}p += {}".format(indent, arg))
+                lines.append("{}if p >= len(c):".format(indent))
+                lines.append("{}    p = right(p)".format(indent))
+            else:
+                lines.append("{}p -= {}".format(indent, -arg))
+                lines.append("{}if p < 0:".format(indent))
+                lines.append("{}    p = left(p)".format(indent))
+        elif op == compiler.OUTPUT:
+            lines.append("{}write_byte_fn(c[p])".format(indent))
+        elif op == compiler.INPUT:
+            lines.append("{}c[p] = read_byte_fn()".format(indent))
+        elif op == compiler.JUMP_IF_ZERO:
+            flush(steps)
+            _emit_loop(program, position, arg, lines, depth, loops, positions)
+            position = arg + 1
+            continue
+        elif op in (compiler.CLEAR, compiler.MULADD, compiler.SCAN):
+            flush(1)
+            _emit_idiom(program, position, lines, depth, loops, positions)
+            position = arg[0] + 1
+            continue
+
+        pending_steps += steps
+        position += 1
+
+    flush()
+
+
+def _emit_loop(program, start, end, lines, depth, loops, positions):
+    # The opening check has already been counted; each pass counts its body and the closing check
+    if loops == _MAX_LOOPS:
+        raise _TooDeep()
+    indent = "    " * depth
+    lines.append("{}while c[p]:".format(indent))
+    _emit_block(program, start + 1, end + 1, lines, depth + 1, loops + 1, positions)
+    # Like the other engines, limits see the step count before the closing check that jumps back
+    lines.append("{}    if steps > budget and c[p]:".format(indent))
+    lines.append("{}        budget = limits.check(steps - 1, {}, p)".format(indent, positions[end]))
+
+
+def _emit_idiom(program, position, lines, depth, loops, positions):
+    # The opening check has already been counted; the idiom adds the steps of the skipped passes
+    indent = "    " * depth
+    op, arg, _ = program[position]
+    start = position + 1
+    end = arg[0]
+
+    if op == compiler.CLEAR:
+        _, per_iter, direction = arg
+        lines.append("{}if c[p]:".format(indent))
+        lines.append("{}    n = {}".format(indent, _iterations("c[p]", direction)))
+        lines.append("{}    if steps + n * {} >= budget:".format(indent, per_iter))
+        _emit_loop(program, start, end, lines, depth + 2, loops, positions)
+        lines.append("{}    else:".format(indent))
+        lines.append("{}        steps += n * {}".format(indent, per_iter))
+        lines.append("{}        c[p] = 0".format(indent))
+        return
+
+    if op == compiler.MULADD:
+        _, per_iter, direction, low, high, targets = arg
+        lines.append("{}if c[p]:".format(indent))
+        lines.append("{}    n = {}".format(indent, _iterations("c[p]", direction)))
+        lines.append("{}    if steps + n * {} >= budget or p < {} or not reserve(p + {}):".format(indent, per_iter, -low, high))
+        _emit_loop(program, start, end, lines, depth + 2, loops, positions)
+        lines.append("{}    else:".format(indent))
+        body_indent = indent + "        "
+        for offset, factor in targets:
+            lines.append("{0}c[p + {1}] = (c[p + {1}] + n * {2}) & 255".format(body_indent, offset, factor))
+        lines.append("{}c[p] = 0".format(body_indent))
+        lines.append("{}steps += n * {}".format(body_indent, per_iter))
+        return
+
+    _, per_iter, stride = arg
+    lines.append("{}t = find_zero(c, p, {})".format(indent, stride))
+    lines.append("{}if t is None or steps + (t - p) // {} * {} >= budget or not reserve(t):".format(indent, stride, per_iter))
+    _emit_loop(program, start, end, lines, depth + 1, loops, positions)
+    lines.append("{}else:".format(indent))
+    lines.append("{}    steps += (t - p) // {} * {}".format(indent, stride, per_iter))
+    lines.append("{}    p = t".format(indent))
+
+
+def _iterations(value, direction):
+    return value if direction < 0 else "(256 - {})".format(value)
@@ -0,0 +1,175 @@
+# Brainfuck Compiler
+# Folds cleaned brainfuck code into a compact instruction array and executes it.
+#
+# Each instruction is an (opcode, arg, steps) tuple.  'steps' is the number of
+# source characters the instruction stands for, so the number of steps reported
+# by execute() matches the one reported by the simple character interpreter.
+#
+# The idiom instructions (CLEAR, MULADD, SCAN) are produced by the optimizer.
+# Each one precedes the loop it replaces and jumps past that loop when it
+# applies; otherwise execution falls through into the original loop.  They
+# count their own steps, so their 'steps' field is 0.
+
+ADD, MOVE, JUMP_IF_ZERO, JUMP_IF_NONZERO, OUTPUT, INPUT, CLEAR, MULADD, SCAN = range(9)
+
+
+def compile_program(code, bracemap):
+    """
+    Compiles cleaned code into a list of (opcode, arg, steps) instructions.
+    Runs of '+'/'-' fold into ADD n (mod 256), runs of a single '>' or '<' fold into MOVE n.
+    Mixed '<'/'>' runs are not folded since '<' clamps at cell 0.
+    Jump targets are resolved from the bracemap and point at the matching jump instruction.
+    """
+    program, jumps = [], {}
+    position = 0
+
+    while position < len(code):
+        command = code[position]
+
+        if command == "+" or command == "-":
+            end, delta = position, 0
+            while end < len(code) and (code[end] == "+" or code[end] == "-"):
+                delta += 1 if code[end] == "+" else -1
+                end += 1
+            program.append((ADD, delta % 256, end - position))
+            position = end
+            continue
+
+        if command == ">" or command == "<":
+            end = position
+            while end < len(code) and code[end] == command:
+                end += 1
+            count = end - position
+            program.append((MOVE, count if command == ">" else -count, count))
+            position = end
+            continue
+
+        if command == "[":
+            if position not in bracemap:
+                raise RuntimeError("Unmatched '[' at position {}".format(position))
+            jumps[position] = len(program)
+            program.append(None)
+        if command == "]":
+            start = jumps[bracemap[position]]
+            program[start] = (JUMP_IF_ZERO, len(program), 1)
+            program.append((JUMP_IF_NONZERO, start, 1))
+
+        if command == ".":
+            program.append((OUTPUT, 0, 1))
+        if command == ",":
+            program.append((INPUT, 0, 1))
+
+        position += 1
+
+    return program
+
+
+def execute(program, tape, read_byte_fn, write_byte_fn, limits=None):
+    """
+    Runs a compiled program on the tape and returns the number of steps (source characters) executed.
+    limits (a Limits instance) are checked when a loop jumps back. An idiom that would take the steps past
+    the next check runs as its loop instead, so limits stop it where they stop the other engines.
+    """
+    cells, codeptr, cellptr, num_steps = tape.cells, 0, 0, 0
+    budget = limits.start(tape) if limits else float("inf")
+    positions = source_positions(program) if limits else None
+    program_len = len(program)
+
+    while codeptr < program_len:
+        op, arg, steps = program[codeptr]
+
+        if op == ADD:
+            cells[cellptr] = (cells[cellptr] + arg) & 0xff
+        elif op == MOVE:
+            cellptr += arg
+            if cellptr < 0:
+                cellptr = tape.left(cellptr)
+            elif cellptr >= len(cells):
+                cellptr = tape.right(cellptr)
+        elif op == JUMP_IF_ZERO:
+            if cells[cellptr] == 0:
+                codeptr = arg
+        elif op == JUMP_IF_NONZERO:
+            if cells[cellptr] != 0:
+                if num_steps >= budget:
+                    budget = limits.check(num_steps, positions[codeptr], cellptr)
+                codeptr = arg
+        elif op == CLEAR:
+            end, per_iter, direction = arg
+            value = cells[cellptr]
+            if value:
+                cost = 1 + _iterations(value, direction) * per_iter
+                if num_steps + cost < budget:
+                    num_steps += cost
+                    cells[cellptr] = 0
+                    codeptr = end
+        elif op == MULADD:
+            end, per_iter, direction, low, high, targets = arg
+            value = cells[cellptr]
+            if not value:
+                num_steps += 1
+                codeptr = end
+            else:
+                iterations = _iterations(value, direction)
+                cost = 1 + iterations * per_iter
+                if num_steps + cost < budget and cellptr + low >= 0 and tape.reserve(cellptr + high):
+                    for offset, factor in targets:
+                        cells[cellptr + offset] = (cells[cellptr + offset] + iterations * factor) & 0xff
+                    cells[cellptr] = 0
+                    num_steps += cost
+                    codeptr = end
+        elif op == SCAN:
+            end, per_iter, stride = arg
+            target = find_zero(cells, cellptr, stride)
+            if target is not None:
+                cost = 1 + (target - cellptr) // stride * per_iter
+                if num_steps + cost < budget and tape.reserve(target):
+                    num_steps += cost
+                    cellptr = target
+                    codeptr = end
+        elif op == OUTPUT:
+            write_byte_fn(cells[cellptr])
+        elif op == INPUT:
+            cells[cellptr] = read_byte_fn()
+
+        codeptr += 1
+        num_steps += steps
+
+    return num_steps
+
+
+def source_positions(program):
+    """
+    Returns the position in the cleaned code at which each instruction starts.
+    """
+    positions, position = [], 0
+    for _, _, steps in program:
+        positions.append(position)
+        position += steps
+    return positions
+
+
+def _iterations(value, direction):
+    # Number of times a loop whose counter cell changes by 'direction' (+1/-1) per pass runs
+    return value if direction < 0 else 256 - value
+
+
+def find_zero(cells, cellptr, stride):
+    # Returns the first zero cell reached from cellptr in steps of 'stride' (past the end of
+    # the cells counts as zero), or None when the scan would walk past cell 0 where the
+    # tape policy applies and the original loop must run
+    if stride == 1:
+        target = cells.find(0, cellptr)
+        return len(cells) if target < 0 else target
+    if stride == -1:
+        target = cells.rfind(0, 0, cellptr + 1)
+        return None if target < 0 else target
+    if stride > 0:
+        for position in range(cellptr, len(cells), stride):
+            if cells[position] == 0:
+                return position
+        return cellptr + (len(cells) - cellptr + stride - 1) // stride * stride
+    for position in range(cellptr, -1, stride):
+        if cells[position] == 0:
+            return position
+    return None
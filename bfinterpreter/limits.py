@@ -0,0 +1,75 @@
+# Brainfuck Execution Limits
+# Step budget, wall-clock timeout and cooperative cancellation for the engines.
+#
+# Engines keep a step threshold ('budget') and only call check() when the step
+# count reaches it at a loop back-edge, so limits cost one comparison per loop
+# pass.  check() either raises ExecutionLimitExceeded or returns the next
+# threshold, which also bounds how many steps pass between clock and
+# cancellation checks.
+
+import time
+
+MAX_STEPS, TIMEOUT, CANCELLED = "max_steps", "timeout", "cancelled"
+_CHECK_INTERVAL = 10000
+
+
+class ExecutionLimitExceeded(RuntimeError):
+    def __init__(self, reason, num_steps, codeptr, cellptr, cells):
+        """
+        reason: MAX_STEPS, TIMEOUT or CANCELLED.
+        num_steps: steps executed when the run was stopped.
+        codeptr: position in the cleaned code of the loop back-edge where the run was stopped.
+        cellptr: cell pointer at that time.
+        cells: snapshot (bytes) of the tape at that time.
+        """
+        super().__init__("Execution stopped ({}) after {} steps at code position {}".format(reason, num_steps, codeptr))
+        self.reason = reason
+        self.num_steps = num_steps
+        self.codeptr = codeptr
+        self.cellptr = cellptr
+        self.cells = cells
+
+
+class Limits:
+    def __init__(self, max_steps=None, timeout=None, cancel=None, check_interval=_CHECK_INTERVAL):
+        """
+        max_steps: number of steps after which the run is stopped (None for no limit).
+        timeout: seconds of wall-clock time after which the run is stopped (None for no limit).
+        cancel: object with an is_set() method (e.g. threading.Event); the run is stopped once it is set.
+        check_interval: number of steps between timeout and cancellation checks.
+        """
+        self.max_steps = max_steps
+        self.timeout = timeout
+        self.cancel = cancel
+        self.check_interval = check_interval
+        self._deadline = None
+        self._tape = None
+
+    def start(self, tape):
+        """
+        Starts the clock for a run on the tape and returns the first step threshold.
+        """
+        self._tape = tape
+        self._deadline = time.monotonic() + self.timeout if self.timeout is not None else None
+        return self._next_budget(0)
+
+    def check(self, num_steps, codeptr, cellptr):
+        """
+        Raises ExecutionLimitExceeded if a limit is reached, otherwise returns the next step threshold.
+        """
+        reason = None
+        if self.max_steps is not None and num_steps > self.max_steps:
+            reason = MAX_STEPS
+        elif self._deadline is not None and time.monotonic() > self._deadline:
+            reason = TIMEOUT
+        elif self.cancel is not None and self.cancel.is_set():
+            reason = CANCELLED
+        if reason:
+            raise ExecutionLimitExceeded(reason, num_steps, codeptr, cellptr, bytes(self._tape.cells))
+        return self._next_budget(num_steps)
+
+    def _next_budget(self, num_steps):
+        if self._deadline is None and self.cancel is None:
+            return self.max_steps + 1 if self.max_steps is not None else float("inf")
+        budget = num_steps + self.check_interval
+        return min(budget, self.max_steps + 1) if self.max_steps is not None else budget
@@ -0,0 +1,80 @@
+# Brainfuck Idiom Optimizer
+# Recognises common loop idioms in a compiled program and prefixes each of them
+# with a constant-time instruction:
+#
+#   [-] [+]                   CLEAR   cell = 0
+#   [->+>++<<] [>+<-] ...     MULADD  cell[p + offset] += cell[p] * factor, cell = 0
+#   [>] [<] [>>] ...          SCAN    move to the first zero cell
+#
+# The original loop is kept right after the idiom instruction so execution can
+# fall back to it whenever the shortcut does not apply (e.g. an offset would
+# cross cell 0, where '<' clamps).
+
+try:
+    from bfinterpreter.compiler import ADD, MOVE, JUMP_IF_ZERO, JUMP_IF_NONZERO, CLEAR, MULADD, SCAN
+except ModuleNotFoundError:
+    from compiler import ADD, MOVE, JUMP_IF_ZERO, JUMP_IF_NONZERO, CLEAR, MULADD, SCAN
+
+
+def optimize(program):
+    """
+    Returns a new program with CLEAR, MULADD and SCAN instructions inserted ahead of every
+    recognised innermost loop. Jump targets are recomputed for the new instruction positions.
+    """
+    optimized, open_loops = [], []
+
+    for position, instr in enumerate(program):
+        op = instr[0]
+
+        if op == JUMP_IF_ZERO:
+            idiom = _match_idiom(program[position + 1:instr[1]])
+            if idiom:
+                optimized.append(idiom)
+            open_loops.append((len(optimized), idiom is not None))
+            optimized.append(instr)
+            continue
+
+        if op == JUMP_IF_NONZERO:
+            start, has_idiom = open_loops.pop()
+            end = len(optimized)
+            optimized[start] = (JUMP_IF_ZERO, end, optimized[start][2])
+            optimized.append((JUMP_IF_NONZERO, start, instr[2]))
+            if has_idiom:
+                # The idiom jumps to the loop's closing instruction, just like JUMP_IF_ZERO
+                idiom_op, idiom_arg, idiom_steps = optimized[start - 1]
+                optimized[start - 1] = (idiom_op, (end,) + idiom_arg[1:], idiom_steps)
+            continue
+
+        optimized.append(instr)
+
+    return optimized
+
+
+def _match_idiom(body):
+    # Only innermost loops made of ADD and MOVE instructions are candidates
+    if not body or any(op != ADD and op != MOVE for op, _, _ in body):
+        return None
+
+    per_iter = 1 + sum(steps for _, _, steps in body)
+
+    if len(body) == 1 and body[0][0] == MOVE:
+        return SCAN, (None, per_iter, body[0][1]), 0
+
+    offset, low, high, deltas = 0, 0, 0, {}
+    for op, arg, _ in body:
+        if op == MOVE:
+            offset += arg
+            low, high = min(low, offset), max(high, offset)
+        else:
+            deltas[offset] = (deltas.get(offset, 0) + arg) % 256
+
+    # The loop has to end where it started and count its own cell down or up by one
+    if offset != 0 or deltas.get(0) not in (1, 255):
+        return None
+
+    direction = 1 if deltas.pop(0) == 1 else -1
+    targets = tuple((target, delta) for target, delta in sorted(deltas.items()) if delta)
+
+    if not targets and low == 0 and high == 0:
+        return CLEAR, (None, per_iter, direction), 0
+    return MULADD, (None, per_iter, direction, low, high, targets), 0
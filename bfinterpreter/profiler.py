@@ -0,0 +1,123 @@
+# Brainfuck Profiler
+# Runs a program on the compiled (unoptimized) instruction array while counting
+# how many times each instruction executes, and how many passes each loop makes.
+# Counts are reported per character of the cleaned code, so they add up to the
+# number of steps the other engines report.
+
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+try:
+    import bfinterpreter.brainfuck as bf
+    import bfinterpreter.compiler as compiler
+    from bfinterpreter.compiler import ADD, MOVE, JUMP_IF_ZERO, JUMP_IF_NONZERO, OUTPUT, INPUT
+    from bfinterpreter.tape import Tape
+    from bfinterpreter.streams import open_streams
+except ModuleNotFoundError:
+    import brainfuck as bf
+    import compiler
+    from compiler import ADD, MOVE, JUMP_IF_ZERO, JUMP_IF_NONZERO, OUTPUT, INPUT
+    from tape import Tape
+    from streams import open_streams
+
+
+@dataclass
+class LoopStats:
+    """
+    entries: times the loop was reached with a non-zero cell.
+    iterations: passes over its body in total, max_iterations: the most passes in one entry.
+    """
+    entries: int = 0
+    iterations: int = 0
+    max_iterations: int = 0
+
+
+@dataclass
+class Profile:
+    """
+    code: the cleaned code that was run, num_steps: the steps executed.
+    counts: the times each character of code was executed.
+    loops: {position of '[' in code: LoopStats} of the loops that were entered.
+    """
+    code: str
+    num_steps: int
+    counts: List[int]
+    loops: Dict[int, LoopStats]
+
+    def hotspots(self, n=10) -> List[Tuple[int, str, int]]:
+        """
+        Returns the n most executed characters as (position, character, count), most executed first.
+        """
+        top = sorted(range(len(self.code)), key=lambda position: -self.counts[position])[:n]
+        return [(position, self.code[position], self.counts[position]) for position in top if self.counts[position]]
+
+
+def profile(code, instream=None, outstream=None, tape=None, max_steps=None, timeout=None, cancel=None) -> Profile:
+    """
+    Runs the code like evaluate() and returns its Profile.
+    Profiling runs unoptimized instructions, so it is slower than the other engines.
+    """
+    code = bf._cleanup(list(code))
+    program = compiler.compile_program(code, bf._buildbracemap(code))
+    input_buffer, output_buffer = open_streams(instream, outstream)
+    try:
+        executions, passes = _execute(program, tape or Tape(), input_buffer.read, output_buffer.write,
+                                      bf._limits(max_steps, timeout, cancel))
+    finally:
+        output_buffer.flush()
+
+    counts, loops = [], {}
+    positions = compiler.source_positions(program)
+    for i, (_, _, steps) in enumerate(program):
+        counts += [executions[i]] * steps
+        if i in passes:
+            loops[positions[i]] = passes[i]
+    return Profile(code, sum(counts), counts, loops)
+
+
+def _execute(program, tape, read_byte_fn, write_byte_fn, limits):
+    # compiler.execute() that counts the executions of each instruction and the passes of each loop
+    cells, codeptr, cellptr, num_steps = tape.cells, 0, 0, 0
+    budget = limits.start(tape) if limits else float("inf")
+    positions = compiler.source_positions(program) if limits else None
+    executions = [0] * len(program)
+    passes = {}  # {index of the loop's JUMP_IF_ZERO: LoopStats}
+    current = {}  # {index of the loop's JUMP_IF_ZERO: passes in the current entry}
+    program_len = len(program)
+
+    while codeptr < program_len:
+        op, arg, steps = program[codeptr]
+        executions[codeptr] += 1
+
+        if op == ADD:
+            cells[cellptr] = (cells[cellptr] + arg) & 0xff
+        elif op == MOVE:
+            cellptr += arg
+            if cellptr < 0:
+                cellptr = tape.left(cellptr)
+            elif cellptr >= len(cells):
+                cellptr = tape.right(cellptr)
+        elif op == JUMP_IF_ZERO:
+            if cells[cellptr] == 0:
+                codeptr = arg
+            else:
+                current[codeptr] = 1
+        elif op == JUMP_IF_NONZERO:
+            if cells[cellptr] != 0:
+                if num_steps >= budget:
+                    budget = limits.check(num_steps, positions[codeptr], cellptr)
+                current[arg] += 1
+                codeptr = arg
+            else:
+                stats = passes.setdefault(arg, LoopStats())
+                stats.entries += 1
+                stats.iterations += current[arg]
+                stats.max_iterations = max(stats.max_iterations, current[arg])
+        elif op == OUTPUT:
+            write_byte_fn(cells[cellptr])
+        elif op == INPUT:
+            cells[cellptr] = read_byte_fn()
+
+        codeptr += 1
+        num_steps += steps
+
+    return executions, passes
@@ -0,0 +1,105 @@
+# Brainfuck Buffered I/O
+# Engines read and write single byte values; these buffers batch them into block
+# writes and chunked reads on the underlying streams.
+#
+# Text streams are encoded as latin-1 so each character maps to one cell value
+# (the same mapping as chr()/ord()); binary streams exchange bytes directly.
+# Output is flushed when a block fills up, before blocking on more input and
+# at the end of a run.
+
+import io
+import sys
+try:
+    import getch
+except ModuleNotFoundError:
+    import bfinterpreter.getch as getch
+
+_BLOCK_SIZE = 8192
+_CHUNK_SIZE = 8192
+
+
+class BufferedOutput:
+    def __init__(self, stream=None, block_size=_BLOCK_SIZE):
+        """
+        stream: text or binary stream to write to (stdout if not given).
+        block_size: number of bytes buffered before they are written out.
+        """
+        self.stream = stream or sys.stdout
+        self.block_size = block_size
+        self._binary = _is_binary(self.stream)
+        self._buffer = bytearray()
+
+    def write(self, value):
+        self._buffer.append(value)
+        if len(self._buffer) >= self.block_size:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        self.stream.write(bytes(self._buffer) if self._binary else self._buffer.decode("latin-1"))
+        self._buffer.clear()
+
+
+class BufferedInput:
+    def __init__(self, stream=None, chunk_size=_CHUNK_SIZE, eof=None, output=None):
+        """
+        stream: text or binary stream to read from. If not given, stdin is read in chunks
+            when it is redirected and one key at a time (raw tty mode) when it is a terminal.
+        chunk_size: number of characters/bytes requested per read. Reads may run ahead of the
+            program, so the stream position afterwards is not defined.
+        eof: value read once the stream is exhausted; EOFError is raised if None.
+        output: BufferedOutput flushed before blocking on the stream, so prompts are visible.
+        """
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.eof = eof
+        self.output = output
+        self._chunk = b""
+        self._pos = 0
+
+    def read(self):
+        if self._pos == len(self._chunk):
+            self._fill()
+            if not self._chunk:
+                if self.eof is None:
+                    raise EOFError("Program read past the end of its input")
+                return self.eof
+        value = self._chunk[self._pos]
+        self._pos += 1
+        return value
+
+    def _fill(self):
+        if self.output:
+            self.output.flush()
+        if self.stream is None:
+            self.stream = _TerminalInput() if sys.stdin.isatty() else sys.stdin.buffer
+
+        # Prefer read1() on buffered binary streams so a pipe doesn't block until a full chunk arrives
+        read = getattr(self.stream, "read1", self.stream.read)
+        chunk = read(self.chunk_size)
+        self._chunk = chunk.encode("latin-1") if isinstance(chunk, str) else chunk
+        self._pos = 0
+
+
+class _TerminalInput:
+    # Stream-like wrapper reading one key at a time in raw tty mode
+    def read(self, _):
+        ch = getch.getch()
+        return ch.encode("latin-1") if isinstance(ch, str) else ch
+
+
+def open_streams(instream=None, outstream=None):
+    """
+    Wraps the streams in a BufferedInput and BufferedOutput, unless they already are.
+    Returns the (input, output) pair with the input flushing the output before blocking.
+    """
+    output_buffer = outstream if isinstance(outstream, BufferedOutput) else BufferedOutput(outstream)
+    input_buffer = instream if isinstance(instream, BufferedInput) else BufferedInput(instream)
+    if input_buffer.output is None:
+        input_buffer.output = output_buffer
+    return input_buffer, output_buffer
+
+
+def _is_binary(stream):
+    return isinstance(stream, (io.RawIOBase, io.BufferedIOBase))
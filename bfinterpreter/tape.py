@@ -0,0 +1,83 @@
+# Brainfuck Data Tape
+# A preallocated bytearray of cells with a configurable growth strategy and a
+# policy for pointers that leave the tape.
+#
+# Engines access 'cells' directly and only call into the tape when the cell
+# pointer leaves the current cells, so the common path costs nothing extra.
+# 'cells' is only ever resized in place, so engines may keep a reference to it.
+
+CLAMP, ERROR, WRAP = "clamp", "error", "wrap"
+GROWTH_DOUBLE = "double"
+
+
+class TapeError(RuntimeError):
+    pass
+
+
+class Tape:
+    def __init__(self, size=1024, growth=GROWTH_DOUBLE, max_size=None, policy=CLAMP):
+        """
+        size: number of cells preallocated.
+        growth: GROWTH_DOUBLE to double the tape when the pointer runs off its right end, None for a fixed tape.
+        max_size: upper bound on the number of cells a growing tape may reach (None for unbounded).
+        policy: what happens to a pointer that leaves the tape (left of cell 0, or right of a tape that can't grow):
+            CLAMP keeps it on the first/last cell, ERROR raises TapeError, WRAP wraps it around to the other end.
+        """
+        if size < 1:
+            raise ValueError("Tape size must be at least 1, got {}".format(size))
+        if growth not in (GROWTH_DOUBLE, None):
+            raise ValueError("Unknown tape growth strategy '{}'".format(growth))
+        if policy not in (CLAMP, ERROR, WRAP):
+            raise ValueError("Unknown tape policy '{}'".format(policy))
+        if policy == WRAP and growth:
+            raise ValueError("A wrapping tape can't grow, use growth=None")
+        if max_size is not None and max_size < size:
+            raise ValueError("Tape max_size {} is smaller than its size {}".format(max_size, size))
+
+        self.cells = bytearray(size)
+        self.growth = growth
+        self.max_size = max_size
+        self.policy = policy
+
+    def left(self, ptr):
+        """
+        Returns where a pointer that moved left of cell 0 ends up.
+        """
+        if self.policy == CLAMP:
+            return 0
+        if self.policy == WRAP:
+            return ptr % len(self.cells)
+        raise TapeError("Cell pointer moved left of cell 0 (to {})".format(ptr))
+
+    def right(self, ptr):
+        """
+        Returns where a pointer that moved right of the last cell ends up, growing the tape if allowed.
+        """
+        if self.reserve(ptr):
+            return ptr
+        if self.policy == CLAMP:
+            # A move of several cells stops on the last cell the tape may grow to, as single moves do
+            if self.max_size is not None:
+                self.reserve(self.max_size - 1)
+            return len(self.cells) - 1
+        if self.policy == WRAP:
+            return ptr % len(self.cells)
+        raise TapeError("Cell pointer moved right of the last cell {} (to {})".format(len(self.cells) - 1, ptr))
+
+    def reserve(self, ptr):
+        """
+        Grows the tape so that ptr is a valid cell if the growth strategy allows it.
+        Returns whether ptr is a valid cell.
+        """
+        size = len(self.cells)
+        if ptr < size:
+            return True
+        if not self.growth or (self.max_size is not None and ptr >= self.max_size):
+            return False
+        new_size = size
+        while new_size <= ptr:
+            new_size *= 2
+        if self.max_size is not None:
+            new_size = min(new_size, self.max_size)
+        self.cells.extend(bytes(new_size - size))
+        return True
@@ -1,7 +1,15 @@
 from unittest import TestCase
 import io
+import threading
 
 import bfinterpreter.brainfuck as bf
+import bfinterpreter.compiler as compiler
+import bfinterpreter.optimizer as optimizer
+from bfinterpreter.batch import run_batch
+from bfinterpreter.profiler import profile
+from bfinterpreter.limits import ExecutionLimitExceeded, MAX_STEPS, TIMEOUT, CANCELLED
+from bfinterpreter.streams import BufferedInput, BufferedOutput
+from bfinterpreter.tape import Tape, TapeError, CLAMP, ERROR, WRAP
 
 
 class TestBFInterpreter(TestCase):
@@ -31,3 +39,222 @@ class TestBFInterpreter(TestCase):
         bf.evaluate(code, instream=instream, outstream=outstream)
 
         self.assertEqual('cz', outstream.getvalue())
+
+    def test_engines_agree(self):
+        # Outputs "Hello World!\n" and exercises clamping of '<' at cell 0
+        code = """
+            <<++++++++++[>+++++++>++++++++++>+++>+<<<<-]
+            >++.>+.+++++++..+++.>++.<<+++++++++++++++.
+            >.+++.------.--------.>+.>.<<<<<<<<+-+.
+            """
+
+        results = []
+        for engine in ("simple", "compiled"):
+            outstream = io.StringIO()
+            num_steps = bf.evaluate(code, outstream=outstream, engine=engine)
+            results.append((outstream.getvalue(), num_steps))
+
+        self.assertEqual("Hello World!\n\x01", results[0][0])
+        self.assertEqual(results[0], results[1])
+
+    def test_unknown_engine(self):
+        self.assertRaises(ValueError, bf.evaluate, "+", engine="nope")
+
+    def test_optimized_idioms(self):
+        # Clear, transfer/multiply, scan loops and a multiply loop crossing cell 0 (falls back)
+        code = "-[-]+++++[->++>+++<<]>>.<.<<[->+<]>>>>+<<[>]>.<<<<+<+[-<+>]>."
+
+        results = []
+        for engine in ("simple", "optimized"):
+            outstream = io.StringIO()
+            num_steps = bf.evaluate(code, outstream=outstream, engine=engine)
+            results.append((outstream.getvalue(), num_steps))
+
+        self.assertEqual(results[0], results[1])
+
+    def test_optimizer_inserts_idioms(self):
+        code = bf._cleanup("[-]>[->+>++<<]>[>]")
+        program = optimizer.optimize(compiler.compile_program(code, bf._buildbracemap(code)))
+
+        ops = [op for op, _, _ in program]
+        self.assertEqual(1, ops.count(compiler.CLEAR))
+        self.assertEqual(1, ops.count(compiler.MULADD))
+        self.assertEqual(1, ops.count(compiler.SCAN))
+
+    def test_python_engine(self):
+        # Reads a char, copies it into the next two cells, scans back to cell 0 and prints both copies plus one
+        code = ",[->+>+<<]>>[<]>+.>+."
+
+        results = []
+        for engine in ("simple", "python"):
+            instream = io.StringIO('A')
+            outstream = io.StringIO()
+            num_steps = bf.evaluate(code, instream=instream, outstream=outstream, engine=engine)
+            results.append((outstream.getvalue(), num_steps))
+
+        self.assertEqual('BB', results[0][0])
+        self.assertEqual(results[0], results[1])
+
+    def test_python_engine_deep_nesting(self):
+        # Python compiles at most 20 nested loops, deeper programs still run
+        for depth in (20, 30):
+            code = "+++" + "[>+" * depth + "<" * depth + "-" + "]" * depth + ">" * depth + "."
+            results = []
+            for engine in ("simple", "python"):
+                outstream = io.StringIO()
+                num_steps = bf.evaluate(code, outstream=outstream, engine=engine)
+                results.append((outstream.getvalue(), num_steps))
+            self.assertEqual(results[0], results[1])
+
+    def test_compile_python_callable(self):
+        program = bf.compile_python(",+.")
+
+        for char in "ab":
+            outstream = io.StringIO()
+            self.assertEqual(3, program(instream=io.StringIO(char), outstream=outstream))
+            self.assertEqual(chr(ord(char) + 1), outstream.getvalue())
+
+    def test_tape_growth(self):
+        tape = Tape(size=2, max_size=5)
+
+        bf.evaluate(">>>+", tape=tape)
+        self.assertEqual(bytearray([0, 0, 0, 1]), tape.cells)
+
+        self.assertRaises(TapeError, bf.evaluate, ">>>>>+", tape=Tape(size=2, max_size=5, policy=ERROR))
+
+    def test_tape_policies(self):
+        # Moves two cells left of cell 0 and then adds one, on each engine
+        for engine in ("simple", "compiled", "optimized", "python"):
+            tape = Tape(size=4, growth=None, policy=CLAMP)
+            bf.evaluate("<<+", tape=tape, engine=engine)
+            self.assertEqual(bytearray([1, 0, 0, 0]), tape.cells)
+
+            tape = Tape(size=4, growth=None, policy=WRAP)
+            bf.evaluate("<<+>>>[-]+++++[->+<]", tape=tape, engine=engine)
+            self.assertEqual(bytearray([0, 0, 6, 0]), tape.cells)
+
+            self.assertRaises(TapeError, bf.evaluate, "<<+", tape=Tape(policy=ERROR), engine=engine)
+
+            # A folded move past max_size clamps to the last cell the tape may grow to
+            tape = Tape(size=2, max_size=5, policy=CLAMP)
+            bf.evaluate(">" * 10 + "+", tape=tape, engine=engine)
+            self.assertEqual(bytearray([0, 0, 0, 0, 1]), tape.cells)
+
+    def test_binary_streams(self):
+        # Echoes input bytes incremented by one until a zero byte
+        code = ",[+.,]"
+
+        outstream = io.BytesIO()
+        bf.evaluate(code, instream=io.BytesIO(b"\x00\xfe\x41\x00"), outstream=outstream)
+        self.assertEqual(b"", outstream.getvalue())
+
+        outstream = io.BytesIO()
+        bf.evaluate(code, instream=io.BytesIO(b"\xfe\x41\x00"), outstream=outstream)
+        self.assertEqual(b"\xff\x42", outstream.getvalue())
+
+    def test_buffered_output_blocks(self):
+        outstream = io.StringIO()
+        output_buffer = BufferedOutput(outstream, block_size=4)
+
+        # The output is flushed once when the block fills up, and once more at the end of the run
+        writes = []
+        outstream.write = lambda s: writes.append(s)
+        bf.evaluate("+" * 65 + "......", outstream=output_buffer)
+        self.assertEqual(["AAAA", "AA"], writes)
+
+    def test_flush_before_input(self):
+        outstream = io.StringIO()
+        seen_before_input = []
+
+        class Input(io.StringIO):
+            def read(self, size=-1):
+                seen_before_input.append(outstream.getvalue())
+                return super().read(size)
+
+        bf.evaluate("+" * 63 + ".,.", instream=Input("!"), outstream=outstream)
+        self.assertEqual(["?"], seen_before_input)
+        self.assertEqual("?!", outstream.getvalue())
+
+    def test_end_of_input(self):
+        self.assertRaises(EOFError, bf.evaluate, ",,", instream=io.StringIO("a"), outstream=io.StringIO())
+
+        outstream = io.StringIO()
+        bf.evaluate(",.,.", instream=BufferedInput(io.StringIO("a"), eof=0), outstream=outstream)
+        self.assertEqual("a\0", outstream.getvalue())
+
+    def test_max_steps(self):
+        # Never terminates: moves right forever adding one to every cell
+        code = "+[>+]"
+
+        errors = []
+        for engine in ("simple", "compiled", "optimized", "python"):
+            with self.assertRaises(ExecutionLimitExceeded) as context:
+                bf.evaluate(code, engine=engine, max_steps=1000)
+            error = context.exception
+            errors.append((error.reason, error.num_steps, error.codeptr, error.cellptr, error.cells[:error.cellptr + 1]))
+
+        self.assertEqual(MAX_STEPS, errors[0][0])
+        self.assertEqual(4, errors[0][2])
+        self.assertEqual(bytes([1] * (errors[0][3] + 1)), errors[0][4])
+        for error in errors[1:]:
+            self.assertEqual(errors[0], error)
+
+    def test_max_steps_in_idioms(self):
+        # The clear, multiply and scan loops stop at the same back-edge on every engine
+        for code in ("+++++[-]", "++++++++++[->+<]", "+>+>+>+>>+<<<<<[>]"):
+            errors = []
+            for engine in ("simple", "compiled", "optimized", "python"):
+                with self.assertRaises(ExecutionLimitExceeded) as context:
+                    bf.evaluate(code, engine=engine, max_steps=12)
+                error = context.exception
+                errors.append((error.num_steps, error.codeptr, error.cellptr, error.cells[:8]))
+            for error in errors[1:]:
+                self.assertEqual(errors[0], error)
+
+    def test_timeout_and_cancel(self):
+        for engine in ("simple", "compiled", "optimized", "python"):
+            with self.assertRaises(ExecutionLimitExceeded) as context:
+                bf.evaluate("+[]", engine=engine, timeout=0.01)
+            self.assertEqual(TIMEOUT, context.exception.reason)
+
+            cancel = threading.Event()
+            cancel.set()
+            with self.assertRaises(ExecutionLimitExceeded) as context:
+                bf.evaluate("+[]", engine=engine, cancel=cancel)
+            self.assertEqual(CANCELLED, context.exception.reason)
+
+        # Limits don't change the result of programs that finish in time
+        outstream = io.StringIO()
+        self.assertEqual(13, bf.evaluate("+++[.-]", outstream=outstream, max_steps=13))
+        self.assertEqual("\x03\x02\x01", outstream.getvalue())
+
+    def test_batch(self):
+        # Echoes its input incremented by one until the end of input
+        code = ",[+.,]"
+        inputs = ["abc", "", "HAL", "x" * 100]
+
+        for workers in (1, 2):
+            results = run_batch(code, inputs, workers=workers, chunksize=1, eof=0)
+            self.assertEqual(["bcd", "", "IBM", "y" * 100], [result.output for result in results])
+            self.assertEqual([14, 2, 14, 402], [result.num_steps for result in results])
+            self.assertEqual([None] * 4, [result.error for result in results])
+
+        results = run_batch("+[]", [b"", b"\x01"], workers=1, max_steps=100)
+        self.assertEqual([b"", b""], [result.output for result in results])
+        self.assertTrue(all("max_steps" in result.error for result in results))
+
+    def test_profiler(self):
+        # Two nested loops: 3 outer passes of 4 inner passes each
+        code = "+++[>++++[>+<-]<-]>>."
+        outstream = io.StringIO()
+        run = profile(code, outstream=outstream)
+        self.assertEqual("\x0c", outstream.getvalue())
+        self.assertEqual(bf.evaluate(code, outstream=io.StringIO(), engine="simple"), run.num_steps)
+        self.assertEqual(run.num_steps, sum(run.counts))
+        self.assertEqual(12, run.counts[code.index(">+<") + 1])
+        self.assertEqual((1, 3, 3), (run.loops[3].entries, run.loops[3].iterations, run.loops[3].max_iterations))
+        self.assertEqual((3, 12, 4), (run.loops[9].entries, run.loops[9].iterations, run.loops[9].max_iterations))
+        self.assertEqual((10, ">", 12), run.hotspots(1)[0])
+
+        with self.assertRaises(ExecutionLimitExceeded):
+            profile("+[]", max_steps=100)
@@ -0,0 +1,32 @@
+from unittest import TestCase
+import copy
+
+from transpiler.benchmark import corpus, kata_programs, run_benchmark, compare
+
+
+class TestTranspilerBenchmark(TestCase):
+    def test_corpus(self):
+        kata = kata_programs()
+        self.assertEqual(1, len(kata))
+        self.assertEqual(("A!", "A ! b"), (kata[0].input, kata[0].output))
+        self.assertEqual(len(kata) + 4, len(corpus()))
+
+    def test_run_and_compare(self):
+        programs = [program for program in corpus() if program.name in ("kata_0", "big_lists")]
+        results = run_benchmark(programs, engines=("optimized", "compiled"))
+        for result in results.values():
+            self.assertLess(0, result["bf_length"])
+            self.assertEqual(result["engines"]["optimized"]["steps"], result["engines"]["compiled"]["steps"])
+        self.assertEqual([], compare(results, results, exact_only=True))
+
+        baseline = copy.deepcopy(results)
+        baseline["big_lists"]["engines"]["optimized"]["steps"] //= 2
+        baseline["kata_0"]["bf_length"] = int(baseline["kata_0"]["bf_length"] * 0.95)
+        regressions = compare(results, baseline, threshold=0.1, exact_only=True)
+        self.assertEqual([("big_lists", "optimized.steps")], [(r.program, r.metric) for r in regressions])
+
+        # A program that broke or is missing is a regression
+        broken = dict(results, kata_0={"error": "boom"})
+        self.assertEqual([("kata_0", "error", "boom")],
+                         [(r.program, r.metric, r.error) for r in compare(broken, results, exact_only=True)])
+        self.assertEqual(["big_lists", "kata_0"], sorted(r.program for r in compare({}, results)))
@@ -0,0 +1,125 @@
+from unittest import TestCase, mock
+import io
+import os
+import tempfile
+
+import transpiler.transpiler
+from transpiler.transpiler import transpile
+from transpiler.cache import TranspileCache, FragmentCache
+from bfinterpreter.brainfuck import evaluate
+
+
+class TestTranspilerCache(TestCase):
+    CODE = """
+        var X
+        set X 'a'
+        msg "X is " X
+        """
+
+    def test_memory_cache(self):
+        cache = TranspileCache()
+        bf = transpile(self.CODE, cache=cache)
+
+        with mock.patch.object(transpiler.transpiler, "_transpile") as _transpile:
+            self.assertEqual(bf, transpile(self.CODE, cache=cache))
+            _transpile.assert_not_called()
+
+    def test_disk_cache_shared_between_instances(self):
+        with tempfile.TemporaryDirectory() as directory:
+            bf = transpile(self.CODE, cache=TranspileCache(directory))
+
+            with mock.patch.object(transpiler.transpiler, "_transpile") as _transpile:
+                self.assertEqual(bf, transpile(self.CODE, cache=TranspileCache(directory)))
+                _transpile.assert_not_called()
+
+            self.assertEqual([], [f for f in os.listdir(directory) if not f.endswith(".bf")])
+
+    def test_disk_cache_eviction(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = TranspileCache(directory, max_entries=1, max_bytes=250)
+            for i in range(5):
+                cache.put(cache.key(str(i)), "+" * 100)
+                os.utime(cache._path(cache.key(str(i))), (i, i))
+
+            self.assertEqual(2, len(os.listdir(directory)))
+            self.assertIsNone(cache.get(cache.key("0")))
+            self.assertEqual("+" * 100, cache.get(cache.key("3")))
+
+    def test_disk_cache_removes_stale_temp_files(self):
+        # A crashed write leaves its temp file behind; it is removed once no write could still be using it
+        with tempfile.TemporaryDirectory() as directory:
+            cache = TranspileCache(directory)
+            stale, fresh = (os.path.join(directory, name) for name in ("stale.tmp", "fresh.tmp"))
+            for path in (stale, fresh):
+                with open(path, "w") as f:
+                    f.write("+" * 100)
+            os.utime(stale, (0, 0))
+            cache.put(cache.key("x"), "+")
+
+            self.assertEqual(sorted(["fresh.tmp", cache.key("x") + ".bf"]), sorted(os.listdir(directory)))
+
+    def test_key(self):
+        self.assertEqual(TranspileCache.key("var x"), TranspileCache.key("var x"))
+        self.assertNotEqual(TranspileCache.key("var x"), TranspileCache.key("var y"))
+        self.assertNotEqual(TranspileCache.key("var x"), TranspileCache.key("var x", optimize=True))
+
+
+class TestTranspilerFragments(TestCase):
+    PROCS = """proc double x
+        add x x x
+        end
+        proc show x
+        call double x
+        msg x
+        end
+        """
+    BODY = ["var a b", "set a 3", "call show a", "set b a", "call double b", "msg b \"!\""]
+
+    def _check(self, code, fragments, **options):
+        report, full_report = {}, {}
+        bf = transpile(code, fragments=fragments, report=report, **options)
+        self.assertEqual(transpile(code, report=full_report, **options), bf)
+        if "source_map" in report:
+            self.assertEqual(full_report["source_map"], report["source_map"])
+        return report["fragments"]
+
+    def test_only_changed_instructions_generated(self):
+        fragments = FragmentCache()
+        stats = self._check(self.PROCS + "\n".join(self.BODY), fragments, layout=False)
+        self.assertEqual((0, 5), (stats.reused, stats.generated))
+
+        # The instructions before the change are reused, and those after it once the generator is in the same state
+        # again: the call after it allocates the temp that set b a allocated before
+        body = list(self.BODY)
+        body[3] = "set b 6"
+        stats = self._check(self.PROCS + "\n".join(body), fragments, layout=False)
+        self.assertEqual((3, 2), (stats.reused, stats.generated))
+
+    def test_layout_kept(self):
+        fragments = FragmentCache()
+        transpile(self.PROCS + "\n".join(self.BODY), fragments=fragments)
+        self.assertFalse(fragments.stats.layout_kept)
+        bf = transpile(self.PROCS + "\n".join(self.BODY).replace("set a 3", "set a 4"), fragments=fragments)
+        self.assertTrue(fragments.stats.layout_kept)
+        outstream = io.StringIO()
+        evaluate(bf, instream=io.StringIO(), outstream=outstream)
+        self.assertEqual("\x08\x10!", outstream.getvalue())
+
+        # A new variable does not fit the layout, which is planned again
+        transpile("var c\n" + self.PROCS + "\n".join(self.BODY), fragments=fragments)
+        self.assertFalse(fragments.stats.layout_kept)
+
+    def test_lines_moved(self):
+        fragments = FragmentCache()
+        self._check(self.PROCS + "\n".join(self.BODY), fragments, optimize=False)
+        stats = self._check("\n\n" + self.PROCS + "\n".join(self.BODY), fragments, optimize=False)
+        self.assertEqual((5, 0), (stats.reused, stats.generated))
+
+    def test_procedure_changed(self):
+        fragments = FragmentCache()
+        self._check(self.PROCS + "\n".join(self.BODY), fragments, layout=False)
+        # Both calls expand double, so both are generated again, as are the instructions between and after them,
+        # which start from other known values
+        stats = self._check(self.PROCS.replace("add x x x", "inc x 1") + "\n".join(self.BODY), fragments, layout=False)
+        self.assertEqual((1, 4), (stats.reused, stats.generated))
+
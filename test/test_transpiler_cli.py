@@ -0,0 +1,56 @@
+from unittest import TestCase
+import os
+import subprocess
+import sys
+import tempfile
+
+from transpiler.__main__ import main
+from transpiler.transpiler import transpile
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestTranspilerCli(TestCase):
+    CODE = 'var a b\nread a\nadd a 1 b\nmsg b "!"\n'
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+
+    def _path(self, name, content=None):
+        path = os.path.join(self.dir.name, name)
+        if content is not None:
+            with open(path, "wb") as f:
+                f.write(content)
+        return path
+
+    def _read(self, path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    def test_transpile_then_run(self):
+        source, program, output = self._path("s.al", self.CODE.encode()), self._path("s.bf"), self._path("out")
+        self.assertEqual(0, main(["transpile", source, "-o", program, "--no-optimize", "--constants", "linear"]))
+        self.assertEqual(0, main(["run", program, "-i", self._path("in", b"\xfe"), "-o", output]))
+        self.assertEqual(b"\xff!", self._read(output))
+
+    def test_transpile_optimized(self):
+        # The default options stream the optimized code, which is the same as transpile()'s
+        source, program = self._path("s.al", self.CODE.encode()), self._path("s.bf")
+        self.assertEqual(0, main(["transpile", source, "-o", program]))
+        self.assertEqual(transpile(self.CODE).encode(), self._read(program))
+
+    def test_exec_errors(self):
+        source, output = self._path("s.al", self.CODE.encode()), self._path("out")
+        self.assertEqual(1, main(["exec", source, "-i", self._path("in", b""), "-o", output]))
+        self.assertEqual(0, main(["exec", source, "-i", self._path("in", b""), "-o", output, "--eof", "64"]))
+        self.assertEqual(b"A!", self._read(output))
+        self.assertEqual(1, main(["run", self._path("loop.bf", b"+[]"), "--max-steps", "100", "-i", source]))
+
+    def test_pipeline(self):
+        env = dict(os.environ, PYTHONPATH=_ROOT)
+        bf = subprocess.run([sys.executable, "-m", "transpiler", "transpile"], input=self.CODE.encode(),
+                            capture_output=True, check=True, env=env).stdout
+        run = subprocess.run([sys.executable, "-m", "transpiler", "run", self._path("s.bf", bf)], input=b"Q",
+                             capture_output=True, check=True, env=env)
+        self.assertEqual(b"R!", run.stdout)
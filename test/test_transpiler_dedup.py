@@ -0,0 +1,52 @@
+from unittest import TestCase
+import io
+
+from transpiler.transpiler import transpile
+from transpiler.dedup import DEDUP_OFF, DEDUP_AUTO, DEDUP_ALWAYS
+import bfinterpreter.brainfuck as bf
+
+
+class TestTranspilerDedup(TestCase):
+    CODE = """
+        var a b c
+        set a 1
+        set b 2
+        proc step x y
+          add x y c
+          mul c y x
+          msg x
+        end
+        call step a b
+        inc b 1
+        call step a b
+        msg "-"
+        call step b a
+        call step a b
+        """
+
+    def _run(self, program):
+        outstream = io.StringIO()
+        bf.evaluate(program, outstream=outstream)
+        return outstream.getvalue()
+
+    def test_modes(self):
+        outputs, sizes = {}, {}
+        for mode in (DEDUP_OFF, DEDUP_AUTO, DEDUP_ALWAYS):
+            report = {}
+            program = transpile(self.CODE, dedup=mode, report=report)
+            outputs[mode], sizes[mode] = self._run(program), len(program)
+            if mode == DEDUP_OFF:
+                self.assertNotIn("dedup", report)
+            else:
+                decision, = report["dedup"]
+                self.assertEqual((["step", "a", "b"], 3, True), (decision.call, decision.sites, decision.applied))
+                self.assertLess(0, decision.chars_saved)
+        self.assertEqual("\x06\x1b-*R", outputs[DEDUP_OFF])
+        self.assertEqual(outputs[DEDUP_OFF], outputs[DEDUP_AUTO])
+        self.assertEqual(outputs[DEDUP_OFF], outputs[DEDUP_ALWAYS])
+        self.assertLess(sizes[DEDUP_ALWAYS], sizes[DEDUP_OFF])
+
+    def test_not_worth_it(self):
+        report = {}
+        transpile("var a\nproc p\ninc a 1\nend\ncall p\ncall p", dedup=DEDUP_AUTO, report=report)
+        self.assertFalse(report["dedup"][0].applied)
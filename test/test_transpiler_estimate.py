@@ -0,0 +1,59 @@
+from unittest import TestCase
+import io
+import math
+
+from transpiler.estimate import estimate, format_estimate, UNBOUNDED, DATA_DEPENDENT, COSTLY
+from transpiler.profile import profile_source
+from transpiler.transpiler import transpile
+
+
+class TestTranspilerEstimate(TestCase):
+    CODE = """var a b c d l[8] i
+        read a
+        set b a
+        mul a b c
+        msg "done"
+        divmod c a d b
+        set i 5
+        lset l i d
+        lget l i c
+        msg d b c
+        """
+
+    def test_bounds(self):
+        result = estimate(self.CODE)
+        self.assertEqual(len(transpile(self.CODE, optimize=False)), result.size)
+        self.assertEqual(len(transpile(self.CODE)), result.optimized_size)
+        self.assertEqual(result.size, sum(s.size for s in result.statements))
+        self.assertEqual([2, 3, 4, 5, 6, 7, 8, 9, 10], [s.line for s in result.statements])
+        self.assertEqual("divmod", result.statements[4].instr)
+
+        for value in (0, 1, 9, 255):
+            lines = {line.line: line.steps for line in profile_source(self.CODE, io.StringIO(chr(value)), io.StringIO())}
+            for s in result.statements:
+                self.assertLessEqual(s.min_steps, lines.get(s.line, 0), s.source)
+                self.assertGreaterEqual(s.max_steps, lines.get(s.line, 0), s.source)
+        # Straight-line code costs the same whatever the input
+        self.assertEqual([], result.statements[3].flags)
+        self.assertEqual([DATA_DEPENDENT], result.statements[1].flags)
+        self.assertIn("msg \"done\"", format_estimate(result))
+
+    def test_formula(self):
+        # Copying a counts it down twice, through a temp
+        result = estimate("var a b\nread a\nset b a")
+        formula = result.statements[-1].formula
+        self.assertRegex(formula, r"^\d+ \+ \d+\*a$")
+        for value in (0, 7, 200):
+            lines = profile_source("var a b\nread a\nset b a", io.StringIO(chr(value)), io.StringIO())
+            self.assertEqual(next(line.steps for line in lines if line.line == 3), eval(formula, {"a": value}))
+
+    def test_flags(self):
+        # An index read from the input may be past the list
+        result = estimate("var l[4] i v\nread i\nlset l i v\nmsg v")
+        self.assertEqual([UNBOUNDED, DATA_DEPENDENT, COSTLY], result.statements[1].flags)
+        self.assertEqual(math.inf, result.max_steps)
+        self.assertEqual([3], [s.line for s in result.flagged(UNBOUNDED)])
+
+        result = estimate("var a b c\nread a\nmul a a b\nmul b a c", costly=1000)
+        self.assertEqual([3, 4], [s.line for s in result.flagged(COSTLY)])
+        self.assertEqual([], result.flagged(UNBOUNDED))
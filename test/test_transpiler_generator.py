@@ -0,0 +1,141 @@
+from unittest import TestCase
+
+import io
+
+from transpiler.old import BrainfuckGenerator, Var, CONSTANTS_LINEAR, CONSTANTS_SIZE, CONSTANTS_STEPS
+from transpiler.transpiler import transpile
+import bfinterpreter.brainfuck as bf
+
+
+class TestTranspilerGenerator(TestCase):
+    def _generator(self, *names, constants=CONSTANTS_LINEAR):
+        generator = BrainfuckGenerator(constants)
+        generator.declare_vars([Var(name) for name in names])
+        return generator
+
+    def test_literals_use_known_values(self):
+        generator = self._generator("x")
+        x = ">"
+        generator.set_var(["x", "250"])
+        generator.set_var(["x", "252"])
+        generator.inc_var(["x", "10"])
+        self.assertEqual(x + "-" * 6 + "++" + "+" * 10, generator.get_program())
+
+    def test_msg_writes_deltas(self):
+        generator = self._generator("x")
+        generator.print_output(['"ab"'])
+        self.assertEqual("+" * 97 + ".+.", generator.get_program())
+
+    def test_loops_invalidate_values(self):
+        generator = self._generator("x", "y")
+        generator.set_var(["x", "y"])
+        generator.set_var(["y", "5"])
+        generator.set_var(["x", "5"])
+        # y was emptied and restored by loops, so both cells need clearing
+        self.assertEqual(2, generator.get_program().count("[-]"))
+
+    def test_temps_are_shared(self):
+        generator = self._generator("a", "b", "c")
+        generator.set_var(["a", "b"])
+        generator.add(["a", "b", "c"])
+        generator.mul(["a", "b", "c"])
+        generator.div(["c", "b", "a"])
+        cells = generator.cells()
+        # Two single temps, live together in add, mul and div, and the divmod block
+        self.assertEqual(["__out__", "a", "b", "c", "__t0__", "__t1__", "__t2__"], list(cells))
+        self.assertEqual(6, cells["__t2__"][1] - cells["__t2__"][0])
+
+    def test_literal_operands(self):
+        # Repeated instructions pick among existing temps, placed by their variable operands only
+        code = """var x y
+            set y 50
+            add 10 y x
+            add 10 y x
+            msg x
+            sub y 1 x
+            sub y 1 x
+            msg x
+            mul y 3 x
+            mul y 3 x
+            msg x
+            div y 7 x
+            div y 7 x
+            msg x
+            mod y 7 x
+            mod y 7 x
+            msg x
+            divmod y 7 x y
+            divmod 23 y x y
+            msg x y
+            """
+        outstream = io.StringIO()
+        bf.evaluate(transpile(code), outstream=outstream)
+        self.assertEqual([60, 49, 150, 7, 1, 23, 0], [ord(c) for c in outstream.getvalue()])
+
+    def test_aliased_operands(self):
+        code = """var x y
+            proc twice a b
+            inc a b
+            end
+            set x 3
+            set x x
+            inc x x
+            msg x
+            dec x x
+            msg x
+            set x 5
+            call twice x x
+            mul x x y
+            msg x y
+            mul x x x
+            msg x
+            mul 10 20 y
+            mul 4 y y
+            mul y 2 x
+            msg y x
+            add x x x
+            sub y x y
+            divmod x y x y
+            msg x y
+            """
+        outstream = io.StringIO()
+        bf.evaluate(transpile(code), outstream=outstream, max_steps=1000000)
+        self.assertEqual([6, 0, 10, 100, 100, 32, 64, 0, 128], [ord(c) for c in outstream.getvalue()])
+
+    def test_constant_strategies(self):
+        text = "Hello, World!"
+        sizes, steps = {}, {}
+        for constants in (CONSTANTS_LINEAR, CONSTANTS_SIZE, CONSTANTS_STEPS):
+            generator = self._generator("x", constants=constants)
+            generator.set_var(["x", "100"])
+            generator.print_output(['"{}"'.format(text), "x"])
+            program = generator.get_program()
+            outstream = io.StringIO()
+            steps[constants] = bf.evaluate(program, outstream=outstream)
+            sizes[constants] = len(program)
+            self.assertEqual(text + "d", outstream.getvalue())
+        self.assertLess(sizes[CONSTANTS_SIZE], sizes[CONSTANTS_LINEAR] * 2 // 3)
+        self.assertLessEqual(steps[CONSTANTS_STEPS], steps[CONSTANTS_SIZE])
+
+    def test_lists(self):
+        generator = BrainfuckGenerator(CONSTANTS_LINEAR)
+        generator.declare_vars([Var("l", 4), Var("m", 4, indexed=True), Var("i")])
+        # Lists indexed by literals only are not interleaved
+        self.assertEqual(4, generator.cells()["l"][1] - generator.cells()["l"][0])
+        self.assertEqual(15, generator.cells()["m"][1] - generator.cells()["m"][0])
+        with self.assertRaises(RuntimeError):
+            generator.lset(["l", "4", "1"])
+        with self.assertRaises(RuntimeError):
+            generator.lget(["l", "i", "i"])
+
+    def test_list_steps_follow_index(self):
+        # A runtime index walks to its element, so the steps depend on the index and not the list size
+        steps = {}
+        for size in (8, 64):
+            for index in (1, 6):
+                code = "var l[{}] i x\nset i {}\nlset l i 7\nlget l i x\nmsg x".format(size, index)
+                outstream = io.StringIO()
+                steps[size, index] = bf.evaluate(transpile(code), outstream=outstream)
+                self.assertEqual("\x07", outstream.getvalue())
+        self.assertLess(steps[8, 1], steps[8, 6])
+        self.assertLess(abs(steps[64, 6] - steps[8, 6]), steps[8, 6] // 10)
@@ -0,0 +1,87 @@
+from unittest import TestCase
+import io
+import sys
+
+from transpiler.parser import tokenize, parse, inline, VarTable, Visitor, ARG_VAR, ARG_LIST, ARG_CHAR, ARG_INT, ARG_STR
+from transpiler.transpiler import transpile
+import bfinterpreter.brainfuck as bf
+
+
+class TestTranspilerInline(TestCase):
+    def _parse(self, code):
+        proc_table = {}
+        ast = parse(tokenize(io.StringIO(code)), var_table=VarTable(), proc_table=proc_table)
+        return ast, proc_table
+
+    def _flatten(self, node):
+        instrs, stack = [], [node]
+        while stack:
+            node = stack.pop()
+            if node.instr not in ("", "call", "proc"):
+                instrs.append([node.instr] + list(node.args))
+            stack.extend(reversed(node.children))
+        return instrs
+
+    def test_copy_per_call_site(self):
+        ast, proc_table = self._parse("""
+            var a b
+            proc twice x
+              inc x 2
+            end
+            call twice a
+            call twice b
+            """)
+        inline(ast, proc_table)
+        self.assertEqual([["inc", "a", "2"], ["inc", "b", "2"]], self._flatten(ast))
+        self.assertEqual([["inc", "x", "2"]], self._flatten(proc_table["twice"].ast))
+
+    def test_deep_call_chain(self):
+        depth = sys.getrecursionlimit() * 2
+        code = ["var v"]
+        code += ["proc p{} x\ncall p{} x\nend".format(i, i + 1) for i in range(depth)]
+        code += ["proc p{} x\ninc x 'A'\nend".format(depth), "call p0 v", "msg v"]
+        outstream = io.StringIO()
+        bf.evaluate(transpile("\n".join(code)), outstream=outstream)
+        self.assertEqual("A", outstream.getvalue())
+
+    def test_deep_nesting(self):
+        depth = sys.getrecursionlimit() * 2
+        ast, proc_table = self._parse("var a\n" + "ifeq a 0\n" * depth + "inc a 1\n" + "end\n" * depth)
+        inline(ast, proc_table)
+        self.assertEqual(depth + 1, len(self._flatten(ast)))
+
+    def test_errors(self):
+        for code in ("proc p\ncall p\nend\ncall p",
+                     "proc p\nproc q\nend\nend",
+                     "proc whatever\nvar Q\nend\ncall whatever",
+                     "var a\ncall missing a",
+                     "var a\nproc p x y\nend\ncall p a",
+                     "end"):
+            with self.assertRaises(RuntimeError):
+                ast, proc_table = self._parse(code)
+                inline(ast, proc_table)
+
+    def test_arg_kinds(self):
+        ast, _ = self._parse('var a b\nmsg "x" a \'y\' -5\nlset a[3] b 1')
+        self.assertEqual([(ARG_STR, ARG_VAR, ARG_CHAR, ARG_INT), (ARG_LIST, ARG_VAR, ARG_INT)],
+                         [child.kinds for child in ast.children])
+
+    def test_visitor(self):
+        ast, proc_table = self._parse("var a\nproc p x\ninc x 1\nend\nifeq a 0\ncall p a\nend\ndec a 1")
+        inline(ast, proc_table)
+
+        class Recorder(Visitor):
+            def __init__(self):
+                self.visited = []
+
+            def visit_ifeq(self, node):
+                self.visited.append("ifeq")
+                return [lambda: self.visited.append("then")] + node.children + [lambda: self.visited.append("end")]
+
+            def generic_visit(self, node):
+                self.visited.append(" ".join((node.instr,) + node.args).strip())
+                return node.children
+
+        recorder = Recorder()
+        recorder.walk(ast)
+        self.assertEqual(["", "ifeq", "then", "call p a", "inc a 1", "end", "dec a 1"], recorder.visited)
@@ -0,0 +1,49 @@
+from unittest import TestCase
+import io
+
+from transpiler.ir import Add, Loop, Input, Output, Raw, emit, moves, write
+from transpiler.old import BrainfuckGenerator, Var, CONSTANTS_LINEAR
+
+
+class TestTranspilerIR(TestCase):
+    IR = [Input(("a", 0)),
+          Loop(("a", 0), [Add(("b", 1), 2), Add(("a", 0), -1)]),
+          Raw(("b", 0), ">[-]<"),
+          Output(("b", 1))]
+
+    def test_emit(self):
+        position = {"a": 0, "b": 1}
+        self.assertEqual(",[>>++<<-]>>[-]<>.", emit(self.IR, lambda cell: position[cell[0]] + cell[1]))
+        # The cells are symbolic, so the same IR can be emitted with another layout
+        position = {"a": 2, "b": 0}
+        self.assertEqual(">>,[<++>-]<<>[-]<>.", emit(self.IR, lambda cell: position[cell[0]] + cell[1]))
+
+    def test_moves(self):
+        position = {"a": 0, "b": 1}
+        self.assertEqual([(0, 2, 1), (2, 0, 1), (0, 1, 0), (1, 2, 0)],
+                         list(moves(self.IR, lambda cell: position[cell[0]] + cell[1])))
+
+    def test_generator_ir(self):
+        generator = BrainfuckGenerator(CONSTANTS_LINEAR)
+        generator.declare_vars([Var("x"), Var("y")])
+        generator.set_var(["x", "3"])
+        generator.read_input(["y"])
+        generator.set_var(["x", "y"])
+        ir = generator.ir()
+        self.assertEqual([Add(("x", 0), 3), Input(("y", 0))], ir[:2])
+        self.assertEqual(Loop(("y", 0), [Add(("x", 0), 1), Add(("__t0__", 0), 1), Add(("y", 0), 255)]), ir[3])
+        self.assertEqual(generator.get_program(), emit(ir, lambda cell: generator.cells()[cell[0]][0] + cell[1]))
+
+    def test_write_to(self):
+        generator = BrainfuckGenerator()
+        generator.declare_vars([Var("x")])
+        for i in range(2000):
+            generator.print_output(['"{}"'.format("abcdefghij" * (i % 7 + 1))])
+            generator.set_var(["x", str(i)])
+        stream = io.StringIO()
+        generator.write_to(stream)
+        self.assertEqual(generator.get_program(), stream.getvalue())
+
+        stream = io.StringIO()
+        write(self.IR, lambda cell: {"a": 0, "b": 1}[cell[0]] + cell[1], stream, buffer=2)
+        self.assertEqual(",[>>++<<-]>>[-]<>.", stream.getvalue())
@@ -0,0 +1,57 @@
+from unittest import TestCase
+import io
+
+from transpiler.transpiler import transpile, lower
+from transpiler.layout import co_access_graph, _best_position, _edges, _starts
+import bfinterpreter.brainfuck as bf
+
+
+class TestTranspilerLayout(TestCase):
+    CODE = """
+        var a b c d e f g h
+        read a
+        read b
+        set h 3
+        mul h a e
+        divmod a b c f
+        set g 10
+        mul g e c
+        add c f d
+        msg c d
+        """
+
+    def _run(self, program):
+        outstream = io.StringIO()
+        bf.evaluate(program, instream=io.StringIO("\x07\x02"), outstream=outstream)
+        return outstream.getvalue()
+
+    def test_layout_reduces_travel(self):
+        report = {}
+        program = transpile(self.CODE, optimize=False, report=report)
+        stats = report["layout"]
+        self.assertLess(stats.travel_after, stats.travel_before)
+        self.assertLess(stats.cost_after, stats.cost_before)
+
+        unordered = transpile(self.CODE, optimize=False, layout=False)
+        self.assertLess(len(program), len(unordered))
+        self.assertEqual("\xd2\xd3", self._run(unordered))
+        self.assertEqual(self._run(unordered), self._run(program))
+
+    def test_best_position(self):
+        # The costs worked out move by move match those of the whole order
+        _, generator = lower(io.StringIO(self.CODE), layout=False)
+        sizes = {name: end - start for name, (start, end) in generator.cells().items()}
+        graph = co_access_graph(generator.seeks(), generator.cells())
+        edges = _edges(graph)
+
+        def cost(order):
+            starts = _starts(order, sizes)
+            return sum(weight * abs(starts[a[0]] + a[1] - starts[b[0]] - b[1]) for (a, b), weight in graph.items())
+
+        order = list(sizes)
+        for name in order:
+            rest = [other for other in order if other != name]
+            costs = [cost(rest[:i] + [name] + rest[i:]) for i in range(len(order))]
+            best = costs.index(min(costs))
+            expected = best if costs[best] < cost(order) else None
+            self.assertEqual(expected, _best_position(order, name, sizes, edges))
@@ -0,0 +1,76 @@
+from unittest import TestCase
+import io
+
+from transpiler.transpiler import transpile, transpile_stream
+from transpiler.peephole import peephole, peephole_chunks, PeepholeStats
+import bfinterpreter.brainfuck as bf
+
+
+class TestTranspilerPeephole(TestCase):
+    def test_cancel_pairs(self):
+        self.assertEqual(">+.", peephole("><>+-+.")[0])
+        self.assertEqual(">-.", peephole(">" + "+" * 255 + ".")[0])
+        self.assertEqual("+[>+<-]>.", peephole("+[>+<<>-]>.")[0])
+
+    def test_dead_loops(self):
+        # Cells start at zero and a cell is zero after its loop ends
+        self.assertEqual("+[>+<-]>.", peephole("[-]>[.]<+[>+<-][-][.]>.")[0])
+        code, stats = peephole(">[-]+++++[-]++.")
+        self.assertEqual(">++.", code)
+        self.assertEqual(1, stats.dead_loops_removed)
+        self.assertEqual(1, stats.clears_folded)
+        self.assertEqual(len(">[-]+++++[-]++.") - len(code), stats.chars_saved)
+        # 21 steps before, 4 after
+        self.assertEqual(17, stats.steps_saved)
+
+    def test_unknown_pointer(self):
+        # After a scan loop only the current cell is known
+        self.assertEqual(",[>]>[-]<.", peephole(",[>][-]>[-]<.")[0])
+
+    def test_trailing_code_removed(self):
+        self.assertEqual("+.", peephole("+.>>+++<")[0])
+
+    def test_chunks(self):
+        # Pieces split runs and loops anywhere, the code after a piece may still merge into it or remove it
+        code = ">[-]+++++[-]++.><>+-+[>+<<>-]>.+.>>+++<"
+        expected, expected_stats = peephole(code)
+        for cuts in ((1, 4, 9), (14, 15, 16, 17, 18), (24, 27, 33, 38)):
+            pieces = [code[start:end] for start, end in zip((0,) + cuts, cuts + (len(code),))]
+            stats = PeepholeStats()
+            self.assertEqual(expected, "".join(peephole_chunks(pieces, stats)))
+            self.assertEqual(expected_stats, stats)
+        # Code is yielded once nothing after it can change it
+        self.assertEqual([",", "[-]", ">+."], list(peephole_chunks([",", "[-]", ">", "+", ".", "+"])))
+
+    def test_transpile_stream(self):
+        code = "var a b\nread a\nset b 200\nmul a b a\nmsg a b \"!\""
+        report, expected_report = {}, {}
+        outstream = io.StringIO()
+        transpile_stream(io.StringIO(code), outstream, report=report)
+        self.assertEqual(transpile(code, report=expected_report), outstream.getvalue())
+        self.assertEqual(expected_report["peephole"], report["peephole"])
+
+    def test_transpile(self):
+        code = """
+            var a b c
+            read a
+            read b
+            divmod a b c a
+            msg c " " a
+            inc b 3
+            """
+        report = {}
+        optimized = transpile(code, report=report)
+        unoptimized = transpile(code, optimize=False)
+        stats = report["peephole"]
+        self.assertEqual(len(unoptimized) - len(optimized), stats.chars_saved)
+        self.assertLess(0, stats.chars_saved)
+
+        outputs, steps = [], []
+        for program in (unoptimized, optimized):
+            outstream = io.StringIO()
+            steps.append(bf.evaluate(program, instream=io.StringIO("\x11\x05"), outstream=outstream))
+            outputs.append(outstream.getvalue())
+        self.assertEqual("\x03 \x02", outputs[0])
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertLessEqual(stats.steps_saved, steps[0] - steps[1])
@@ -0,0 +1,46 @@
+from unittest import TestCase
+import io
+
+from transpiler.profile import profile_source, format_report
+from transpiler.transpiler import transpile
+import bfinterpreter.brainfuck as bf
+
+
+class TestTranspilerProfile(TestCase):
+    CODE = """var a b c d
+        read a
+        set b a
+        mul a b c
+        msg "done"
+        divmod c a d b
+        msg d b
+        """
+
+    def test_profile_source(self):
+        outstream = io.StringIO()
+        lines = profile_source(self.CODE, instream=io.StringIO("\x09"), outstream=outstream)
+        self.assertEqual("done\x09\x00", outstream.getvalue())
+
+        num_steps = bf.evaluate(transpile(self.CODE, optimize=False), instream=io.StringIO("\x09"), outstream=io.StringIO())
+        self.assertEqual(num_steps, sum(line.steps for line in lines))
+        self.assertAlmostEqual(100.0, sum(line.percent for line in lines))
+        # divmod counts 81 down 9 at a time, mul adds b to c 9 times
+        self.assertEqual([6, 4], [line.line for line in lines[:2]])
+        self.assertEqual("divmod c a d b", lines[0].source)
+        self.assertEqual(81, lines[0].max_iterations)
+        self.assertEqual(9, lines[1].max_iterations)
+        self.assertIn("divmod c a d b", format_report(lines).split("\n")[1])
+
+    def test_source_map_spans(self):
+        report = {}
+        program = transpile(self.CODE, optimize=False, report=report)
+        spans = report["source_map"]
+        self.assertEqual(0, spans[0][0])
+        self.assertEqual(len(program), spans[-1][1])
+        self.assertTrue(all(a[1] == b[0] for a, b in zip(spans, spans[1:])))
+        self.assertEqual({2, 3, 4, 5, 6, 7}, {line for _, _, line in spans})
+
+        # The peephole pass does not keep spans
+        report = {}
+        transpile(self.CODE, report=report)
+        self.assertNotIn("source_map", report)
@@ -0,0 +1,41 @@
+from unittest import TestCase
+import io
+
+from transpiler.parser import tokenize
+
+
+class TestTranspilerTokenize(TestCase):
+    def _tokenize(self, code):
+        return list(tokenize(io.StringIO(code)))
+
+    def test_tokenize(self):
+        code = """
+            VAR X//This is a comment
+            var L [ 5 ] I
+            rem &&Some comment~!@#$":<
+            msg "Bye" X#No doubt it is a comment
+            set x '\\''--comment
+            dec x -20
+            msg"Outer : "A b"\\n""done"
+            rem"""
+        required_result = [
+            ['var', 'x'],
+            ['var', 'l [ 5 ]', 'i'],
+            ['msg', '"Bye"', 'x'],
+            ['set', 'x', "'\\''"],
+            ['dec', 'x', '-20'],
+            ['msg', '"Outer : "', 'a', 'b', '"\\n"', '"done"']]
+
+        self.assertEqual(required_result, self._tokenize(code))
+
+    def test_tokenize_errors(self):
+        with self.assertRaises(RuntimeError) as context:
+            self._tokenize("var a\nmov a 5\n")
+        self.assertEqual("Line 2: Invalid instruction or syntax 'mov a 5\n'", str(context.exception))
+
+        with self.assertRaises(RuntimeError) as context:
+            self._tokenize("var a\n\nset a 'z\n")
+        self.assertEqual("Line 3: Invalid args or syntax ''z\n'", str(context.exception))
+
+        self.assertRaises(RuntimeError, self._tokenize, 'msg " nope')
+        self.assertRaises(RuntimeError, self._tokenize, 'var x[60 Y')
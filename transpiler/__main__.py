@@ -0,0 +1,153 @@
+# Transpiler Command Line
+# Transpiles source code to brainfuck, runs brainfuck programs, or both, reading
+# files or stdin and writing files or stdout, so it can be used in pipelines.
+#
+# Usage: python -m transpiler transpile [options] [SOURCE] [-o OUTPUT]
+#        python -m transpiler run [options] [PROGRAM] [-i INPUT] [-o OUTPUT]
+#        python -m transpiler exec [options] [SOURCE] [-i INPUT] [-o OUTPUT]
+#        python -m transpiler estimate [options] [SOURCE] [-o OUTPUT]
+#   SOURCE and PROGRAM default to stdin ('-'). Program input is read as bytes from
+#   INPUT, or from stdin unless the source itself comes from stdin. transpile writes
+#   the code as it is generated and optimized, so large programs are never held as
+#   one string; exec holds the program to run it.
+
+import argparse
+import contextlib
+import io
+import sys
+
+import bfinterpreter.brainfuck as bf
+from bfinterpreter.streams import BufferedInput
+from transpiler.dedup import DEDUP_OFF, DEDUP_AUTO, DEDUP_ALWAYS
+from transpiler.estimate import estimate, format_estimate
+from transpiler.old import CONSTANTS_LINEAR, CONSTANTS_SIZE, CONSTANTS_STEPS
+from transpiler.transpiler import transpile_stream
+
+
+def main(argv=None) -> int:
+    args = _parser().parse_args(argv)
+    try:
+        with contextlib.ExitStack() as files:
+            return args.command(args, files)
+    except (RuntimeError, EOFError, ValueError, OSError) as e:
+        print("error: {}".format(e), file=sys.stderr)
+        return 1
+
+
+def _transpile(args, files) -> int:
+    source = _open(files, args.source, "r", sys.stdin)
+    output = _open(files, args.output, "w", sys.stdout)
+    report = {} if args.stats else None
+    transpile_stream(source, output, **_transpile_options(args), report=report)
+    _print_stats(report)
+    return 0
+
+
+def _run(args, files) -> int:
+    code = _open(files, args.program, "r", sys.stdin).read()
+    return _evaluate(code, args, files, args.program == "-")
+
+
+def _exec(args, files) -> int:
+    source = _open(files, args.source, "r", sys.stdin)
+    program = io.StringIO()
+    report = {} if args.stats else None
+    transpile_stream(source, program, **_transpile_options(args), report=report)
+    _print_stats(report)
+    return _evaluate(program.getvalue(), args, files, args.source == "-")
+
+
+def _estimate(args, files) -> int:
+    code = _open(files, args.source, "r", sys.stdin).read()
+    output = _open(files, args.output, "w", sys.stdout)
+    options = _transpile_options(args)
+    del options["optimize"]
+    output.write(format_estimate(estimate(code, **options)) + "\n")
+    return 0
+
+
+def _evaluate(code, args, files, stdin_read) -> int:
+    # Without an input file, the program reads stdin, or nothing if its code came from stdin
+    if args.input:
+        instream = _open(files, args.input, "rb", sys.stdin.buffer)
+    elif stdin_read:
+        instream = io.BytesIO()
+    else:
+        instream = sys.stdin.buffer
+    output = _open(files, args.output, "wb", sys.stdout.buffer)
+    num_steps = bf.evaluate(code, BufferedInput(instream, eof=args.eof), output, engine=args.engine,
+                            max_steps=args.max_steps, timeout=args.timeout)
+    output.flush()
+    if args.stats:
+        print("steps: {}".format(num_steps), file=sys.stderr)
+    return 0
+
+
+def _open(files, path, mode, default):
+    if path is None or path == "-":
+        return default
+    return files.enter_context(open(path, mode))
+
+
+def _transpile_options(args) -> dict:
+    return {"optimize": args.optimize, "constants": args.constants, "layout": args.layout, "dedup": args.dedup}
+
+
+def _print_stats(report):
+    for stage, stats in (report or {}).items():
+        print("{}: {}".format(stage, stats), file=sys.stderr)
+
+
+def _parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m transpiler", description="Transpile to brainfuck and run brainfuck.")
+    commands = parser.add_subparsers(required=True, metavar="command")
+
+    transpile = commands.add_parser("transpile", help="transpile source code to brainfuck, streaming the output",
+                                    description="Transpile source code to brainfuck. The code is written as it is "
+                                                "generated and optimized, without holding the whole program.")
+    transpile.add_argument("source", nargs="?", default="-", help="source file (default: stdin)")
+    transpile.add_argument("-o", "--output", help="brainfuck file to write (default: stdout)")
+    _add_transpile_options(transpile)
+    transpile.set_defaults(command=_transpile)
+
+    run = commands.add_parser("run", help="run a brainfuck program")
+    run.add_argument("program", nargs="?", default="-", help="brainfuck file (default: stdin)")
+    _add_run_options(run)
+    run.add_argument("--stats", action="store_true", help="print statistics to stderr")
+    run.set_defaults(command=_run)
+
+    exec_ = commands.add_parser("exec", help="transpile source code and run it")
+    exec_.add_argument("source", nargs="?", default="-", help="source file (default: stdin)")
+    _add_transpile_options(exec_)
+    _add_run_options(exec_)
+    exec_.set_defaults(command=_exec)
+
+    estimate_ = commands.add_parser("estimate", help="estimate the code size and steps of source code without running it")
+    estimate_.add_argument("source", nargs="?", default="-", help="source file (default: stdin)")
+    estimate_.add_argument("-o", "--output", help="file to write the estimate to (default: stdout)")
+    _add_transpile_options(estimate_)
+    estimate_.set_defaults(command=_estimate)
+    return parser
+
+
+def _add_transpile_options(parser):
+    parser.add_argument("--no-optimize", dest="optimize", action="store_false", help="skip the peephole pass")
+    parser.add_argument("--constants", choices=(CONSTANTS_LINEAR, CONSTANTS_SIZE, CONSTANTS_STEPS), default=CONSTANTS_SIZE,
+                        help="how literals are emitted (default: size)")
+    parser.add_argument("--no-layout", dest="layout", action="store_false", help="keep cells in declaration order")
+    parser.add_argument("--dedup", choices=(DEDUP_OFF, DEDUP_AUTO, DEDUP_ALWAYS), default=DEDUP_OFF,
+                        help="emit repeated identical calls once (default: off)")
+    parser.add_argument("--stats", action="store_true", help="print statistics to stderr")
+
+
+def _add_run_options(parser):
+    parser.add_argument("-i", "--input", help="file with the program input (default: stdin)")
+    parser.add_argument("-o", "--output", help="file to write the program output to (default: stdout)")
+    parser.add_argument("--engine", default="optimized", help="interpreter engine (default: optimized)")
+    parser.add_argument("--eof", type=int, default=None, help="value read past the end of the input (default: error)")
+    parser.add_argument("--max-steps", type=int, default=None, help="step budget")
+    parser.add_argument("--timeout", type=float, default=None, help="wall-clock seconds")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
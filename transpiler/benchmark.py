@@ -0,0 +1,206 @@
+# Transpiler Benchmark
+# Runs a corpus of programs (the examples in docs/kata and synthetic stress programs)
+# through transpile() and each interpreter engine, and records transpile time, code
+# length, steps, wall time and peak memory as JSON. Results can be compared with a
+# stored baseline, reporting metrics that grew past a threshold. Nested control flow
+# (ifeq, wneq, ...) is not benchmarked, as the generator does not support it yet; the
+# deepest nesting in the corpus is a chain of procedure calls.
+#
+# Usage: python -m transpiler.benchmark [-o RESULTS] [--baseline FILE] [--threshold 0.1]
+#   Exits with status 1 when a metric regressed against the baseline. The stored
+#   baseline is test/benchmark_baseline.json; its times are machine dependent, so
+#   compare with --exact-only on other machines.
+
+import argparse
+import io
+import json
+import os
+import re
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import bfinterpreter.brainfuck as bf
+from bfinterpreter.tape import Tape
+from transpiler.transpiler import transpile
+
+ENGINES = ("simple", "compiled", "optimized", "python")
+# Metrics that do not depend on the machine
+EXACT_METRICS = ("bf_length", "steps", "tape_cells")
+_KATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "docs", "kata")
+_KATA_EXAMPLE_RE = re.compile(r"kcuf\(`(.*?)`\)\s*runBF\(Code,'(.*?)'\) === '(.*?)'", flags=re.DOTALL)
+
+
+@dataclass
+class Program:
+    name: str
+    code: str
+    input: str = ""
+    output: Optional[str] = None  # expected output, if known
+
+
+@dataclass
+class Regression:
+    program: str
+    metric: str  # "transpile_time", ..., "<engine>.steps", ..., or "error" for a program that no longer runs
+    baseline: Optional[float]
+    current: Optional[float]
+    error: Optional[str] = None  # why the program no longer runs, for "error"
+
+
+def corpus() -> List[Program]:
+    """
+    Returns the kata examples and the synthetic programs.
+    """
+    return kata_programs() + synthetic_programs()
+
+
+def kata_programs() -> List[Program]:
+    with open(_KATA) as f:
+        text = f.read()
+    return [Program("kata_{}".format(i), code, given, expected)
+            for i, (code, given, expected) in enumerate(_KATA_EXAMPLE_RE.findall(text))]
+
+
+def synthetic_programs() -> List[Program]:
+    # A chain of procedures, each calling the next, inlined into one flat block
+    depth = 200
+    calls = ["var v"] + ["proc p{} x\ncall p{} x\nend".format(i, i + 1) for i in range(depth)]
+    calls += ["proc p{} x\ninc x 1\nend".format(depth)] + ["call p0 v"] * 65 + ["msg v"]
+
+    text = "The quick brown fox jumps over the lazy dog. " * 100
+    strings = 'var x\nmsg "{}"\nset x 10\nmsg x'.format(text)
+
+    size = 64
+    lists = ["var l[{}] i v".format(size)]
+    for k in range(0, size, 4):
+        lists += ["set i {}".format(k), "set v {}".format(k + 1), "lset l i v"]
+    for k in range(size - 4, -1, -8):
+        lists += ["set i {}".format(k), "lget l i v", "msg v"]
+
+    divmods = ["var a b c d", "read a"]
+    for k in range(2, 42):
+        divmods += ["set b {}".format(k), "divmod a b c d", "add c d c", "msg c"]
+
+    return [
+        Program("call_chain", "\n".join(calls), "", "A"),
+        Program("long_string", strings, "", text + "\n"),
+        Program("big_lists", "\n".join(lists), "", "".join(chr(k + 1) for k in range(size - 4, -1, -8))),
+        Program("heavy_divmod", "\n".join(divmods), "\xfa"),
+    ]
+
+
+def run_benchmark(programs: List[Program], engines=ENGINES, **options) -> Dict[str, dict]:
+    """
+    Transpiles and runs each program on each engine, with the options of transpile().
+    Returns {program: {"transpile_time", "transpile_peak_kb", "bf_length",
+    "engines": {engine: {"steps", "wall_time", "peak_kb", "tape_cells"}}}}, or {"error": message} for a program
+    that does not transpile. Times are seconds. Peak memory is of the Python allocations of transpile() and of
+    preparing the program for the engine, measured in separate traced calls (tracing a run would slow it down
+    too much); a run's own memory is its tape.
+    Raises RuntimeError if a program's output differs from the expected one.
+    """
+    results = {}
+    for program in programs:
+        start = time.perf_counter()
+        try:
+            code = transpile(program.code, **options)
+        except RuntimeError as e:
+            results[program.name] = {"error": str(e)}
+            continue
+        results[program.name] = {"transpile_time": time.perf_counter() - start,
+                                  "transpile_peak_kb": _peak_kb(lambda: transpile(program.code, **options)),
+                                  "bf_length": len(code),
+                                  "engines": {engine: _run(program, code, engine) for engine in engines}}
+    return results
+
+
+def _run(program: Program, code: str, engine: str) -> dict:
+    peak = _peak_kb(lambda: bf.prepare(code, engine=engine))
+    run = bf.prepare(code, engine=engine)
+    tape, outstream = Tape(), io.StringIO()
+    start = time.perf_counter()
+    steps = run(io.StringIO(program.input), outstream, tape=tape)
+    wall_time = time.perf_counter() - start
+    if program.output is not None and outstream.getvalue() != program.output:
+        raise RuntimeError("{} printed {!r} on engine {}, expected {!r}".format(
+            program.name, outstream.getvalue(), engine, program.output))
+    return {"steps": steps, "wall_time": wall_time, "peak_kb": peak, "tape_cells": len(tape.cells)}
+
+
+def _peak_kb(fn) -> float:
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float = 0.1, exact_only: bool = False) -> List[Regression]:
+    """
+    Returns the metrics of results that are more than threshold (a fraction) above those of baseline,
+    for the programs and engines in both. With exact_only, only the machine independent metrics
+    (EXACT_METRICS) are compared. A program of baseline that ran there but failed or is missing from
+    results is an "error" regression.
+    """
+    regressions = []
+    for name, before in baseline.items():
+        current = results.get(name)
+        if "error" not in before and (current is None or "error" in current):
+            error = "missing from the results" if current is None else current["error"]
+            regressions.append(Regression(name, "error", None, None, error))
+    for name, current in results.items():
+        before = baseline.get(name)
+        if before is None or "error" in current or "error" in before:
+            continue
+        pairs = [(metric, before[metric], current[metric]) for metric in current
+                 if metric != "engines" and metric in before]
+        for engine, metrics in current["engines"].items():
+            if engine in before["engines"]:
+                pairs += [("{}.{}".format(engine, metric), before["engines"][engine][metric], value)
+                          for metric, value in metrics.items() if metric in before["engines"][engine]]
+        for metric, old, new in pairs:
+            if exact_only and metric.split(".")[-1] not in EXACT_METRICS:
+                continue
+            if new > old * (1 + threshold):
+                regressions.append(Regression(name, metric, old, new))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m transpiler.benchmark", description="Benchmark the transpiler and interpreter.")
+    parser.add_argument("-o", "--output", help="JSON file to write the results to (default: stdout)")
+    parser.add_argument("--baseline", help="JSON results to compare with")
+    parser.add_argument("--threshold", type=float, default=0.1, help="fraction a metric may grow by (default: 0.1)")
+    parser.add_argument("--exact-only", action="store_true", help="compare only code length, steps and tape cells")
+    parser.add_argument("--engines", nargs="+", default=ENGINES, choices=ENGINES, help="engines to run")
+    parser.add_argument("--programs", nargs="+", help="names of the programs to run (default: all)")
+    args = parser.parse_args()
+
+    programs = [program for program in corpus() if not args.programs or program.name in args.programs]
+    results = run_benchmark(programs, args.engines)
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = {name: result for name, result in json.load(f).items() if not args.programs or name in args.programs}
+        regressions = compare(results, baseline, args.threshold, args.exact_only)
+        for r in regressions:
+            if r.error is not None:
+                print("{}: no longer runs: {}".format(r.program, r.error), file=sys.stderr)
+            else:
+                print("{}: {} regressed from {:g} to {:g}".format(r.program, r.metric, r.baseline, r.current), file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+import hashlib
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import NamedTuple, Optional
+
+
+def _code_fingerprint() -> str:
+    """
+    Hashes the source of the transpiler modules, so cached output is invalidated whenever the transpiler changes.
+    """
+    digest = hashlib.sha256()
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    for filename in sorted(os.listdir(package_dir)):
+        if filename.endswith(".py"):
+            with open(os.path.join(package_dir, filename), "rb") as f:
+                digest.update(filename.encode())
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+TRANSPILER_VERSION = _code_fingerprint()
+
+
+class TranspileCache:
+    """
+    Cache of transpiled brainfuck keyed by a hash of the source text, the transpiler version and the options.
+    Entries are kept in an in-process LRU and, if a directory is given, in a size-bounded on-disk store
+    that can be shared by concurrent processes: files are written atomically and reads tolerate
+    entries being evicted by another process. Temp files left by a write that crashed are removed by the
+    eviction pass once they are older than any write could take.
+    """
+    _SUFFIX = ".bf"
+    _TEMP_SUFFIX = ".tmp"
+    _STALE_TEMP_SECONDS = 60 * 60
+
+    def __init__(self, directory: Optional[str] = None, max_entries: int = 256, max_bytes: int = 256 * 1024 * 1024):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._memory = OrderedDict()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(code: str, **options) -> str:
+        digest = hashlib.sha256()
+        digest.update(TRANSPILER_VERSION.encode())
+        digest.update(repr(sorted(options.items())).encode())
+        digest.update(code.encode())
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return self._memory[key]
+        if not self.directory:
+            return None
+
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="ascii") as f:
+                bf = f.read()
+            # Mark the entry as recently used for eviction
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        self._remember(key, bf)
+        return bf
+
+    def put(self, key: str, bf: str):
+        self._remember(key, bf)
+        if not self.directory:
+            return
+
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=self._TEMP_SUFFIX)
+        try:
+            with os.fdopen(fd, "w", encoding="ascii") as f:
+                f.write(bf)
+            os.replace(temp_path, self._path(key))
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        self._evict()
+
+    def clear(self):
+        self._memory.clear()
+        if self.directory:
+            for path, _, _ in self._entries():
+                _remove(path)
+
+    def _remember(self, key: str, bf: str):
+        self._memory[key] = bf
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _evict(self):
+        # Removes stale temp files, then least recently used files until the store fits in max_bytes
+        stale = time.time() - self._STALE_TEMP_SECONDS
+        for path, mtime, _ in self._entries(self._TEMP_SUFFIX):
+            if mtime < stale:
+                _remove(path)
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        total = sum(size for _, _, size in entries)
+        for path, _, size in entries:
+            if total <= self.max_bytes:
+                break
+            _remove(path)
+            total -= size
+
+    def _entries(self, suffix=_SUFFIX):
+        entries = []
+        for filename in os.listdir(self.directory):
+            if filename.endswith(suffix):
+                path = os.path.join(self.directory, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((path, stat.st_mtime, stat.st_size))
+        return entries
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + self._SUFFIX)
+
+
+class Fragment(NamedTuple):
+    """
+    The IR generated for a top-level instruction, the source lines of its nodes in walk order (so the IR
+    can be moved to other lines) and the generator state it ended in (see BrainfuckGenerator.state()).
+    """
+    ops: list
+    lines: tuple
+    state: tuple
+
+
+@dataclass
+class FragmentStats:
+    """
+    reused and generated: the top-level instructions whose IR was replayed from the cache or generated.
+    layout_kept: whether the layout of the previous transpile was kept rather than planned again.
+    """
+    reused: int = 0
+    generated: int = 0
+    layout_kept: bool = False
+
+
+class FragmentCache:
+    """
+    Cache of the IR generated for each top-level instruction, for transpiling successive versions of a program
+    incrementally: an instruction (a call by the fingerprint of its procedure's body) generated from the same
+    generator state as before is replayed rather than generated again. Also keeps the layout last planned, which
+    is reused while the program's cells fit it, so the code may differ from that of a transpile without the cache.
+    Fragments are kept in memory, in an LRU of max_entries.
+    """
+    def __init__(self, max_entries: int = 1 << 16):
+        self.max_entries = max_entries
+        self.layout = None  # {name: start cell} of the cells last laid out
+        self.stats = FragmentStats()  # of the last transpile
+        self._fragments = OrderedDict()
+
+    def get(self, key: tuple) -> Optional[Fragment]:
+        fragment = self._fragments.get(key)
+        if fragment is not None:
+            self._fragments.move_to_end(key)
+        return fragment
+
+    def put(self, key: tuple, fragment: Fragment):
+        self._fragments[key] = fragment
+        self._fragments.move_to_end(key)
+        while len(self._fragments) > self.max_entries:
+            self._fragments.popitem(last=False)
+
+    def clear(self):
+        self._fragments.clear()
+        self.layout = None
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,99 @@
+from dataclasses import dataclass
+from typing import List
+
+from transpiler.parser import Node, walk
+
+# Dedup modes: never, when the estimated size saving is worth the extra steps, or for every repeated call
+DEDUP_OFF, DEDUP_AUTO, DEDUP_ALWAYS = "off", "auto", "always"
+
+# Estimated characters (and straight-line steps) of the code of one instruction
+_INSTRUCTION_COST = 30
+# Estimated characters added per segment (its flag test and hand-over) and per dispatch loop
+_SEGMENT_OVERHEAD = 12
+_DISPATCH_OVERHEAD = 20
+# Estimated steps to test one segment flag on one pass of the dispatch loop
+_FLAG_TEST_STEPS = 3
+
+
+@dataclass
+class DedupDecision:
+    """
+    One group of identical calls (same procedure and args) in a block, with the estimated trade-off:
+    chars_saved by emitting the body once, extra_steps spent testing the segment flags.
+    Code in a dispatch loop also starts without known cell values, which may cost more steps.
+    """
+    call: List[str]
+    sites: int
+    body_instructions: int
+    chars_saved: int
+    extra_steps: int
+    applied: bool
+
+
+def dedup_calls(ast: Node, mode: str = DEDUP_AUTO) -> List[DedupDecision]:
+    """
+    Replaces repeated identical calls in a block of an inlined AST with a 'dispatch' node, so the body is
+    emitted once (see BrainfuckGenerator.dispatch_start()). The dispatch node's children are the 'segment'
+    nodes holding the instructions before, between and after the calls, followed by the call node that
+    is kept. In each block, the group of calls with the largest estimated saving is considered.
+    Returns the decision taken for each group considered.
+    """
+    decisions = []
+    if mode == DEDUP_OFF:
+        return decisions
+
+    for node in walk(ast):
+        decision = _plan_block(node, mode)
+        if decision:
+            decisions.append(decision)
+    return decisions
+
+
+def _plan_block(node: Node, mode: str):
+    groups = {}
+    for child in node.children:
+        if child.instr == "call":
+            groups.setdefault(tuple(child.args), []).append(child)
+    groups = [calls for calls in groups.values() if len(calls) > 1]
+    if not groups:
+        return None
+
+    decisions = [_estimate(calls) for calls in groups]
+    decision, calls = max(zip(decisions, groups), key=lambda pair: pair[0].chars_saved)
+    if mode == DEDUP_ALWAYS:
+        decision.applied = decision.chars_saved > 0
+    else:
+        calls_steps = decision.sites * decision.body_instructions * _INSTRUCTION_COST
+        decision.applied = decision.chars_saved > 0 and decision.extra_steps <= calls_steps
+    if decision.applied:
+        _dispatch(node, calls)
+    return decision
+
+
+def _estimate(calls: List[Node]) -> DedupDecision:
+    sites = len(calls)
+    body_instructions = _count_instructions(calls[0])
+    chars_saved = (sites - 1) * body_instructions * _INSTRUCTION_COST - (sites + 1) * _SEGMENT_OVERHEAD - _DISPATCH_OVERHEAD
+    # Each of the sites + 1 passes tests every segment flag
+    extra_steps = (sites + 1) ** 2 * _FLAG_TEST_STEPS
+    return DedupDecision(list(calls[0].args), sites, body_instructions, chars_saved, extra_steps, False)
+
+
+def _count_instructions(node: Node) -> int:
+    return sum(1 for child in walk(node) if child.instr != "call")
+
+
+def _dispatch(node: Node, calls: List[Node]):
+    # Splits the block at the calls into segments and keeps the first call as the shared body
+    dispatch = Node("dispatch", calls[0].args, [], calls[0].line)
+    segment = Node("segment", [], [])
+    call_ids = {id(call) for call in calls}
+    for child in node.children:
+        if id(child) in call_ids:
+            dispatch.children.append(segment)
+            segment = Node("segment", [], [])
+        else:
+            segment.children.append(child)
+    dispatch.children.append(segment)
+    dispatch.children.append(calls[0])
+    node.children = [dispatch]
@@ -0,0 +1,400 @@
+# Static Cost Estimator
+# Estimates what a program costs without running it: the exact size of the code it
+# transpiles to, and the steps each source line takes, as bounds over the values the
+# cells may hold and, where the line's loops count variables down, as a formula in
+# the values those variables hold when the line starts.
+#
+# The steps are worked out over the generator's IR, tracking the range of each cell:
+# straight-line code costs its characters, a loop that counts its cell down costs its
+# pass times the cell's value, and the raw code of divmod and of indexed lset/lget is
+# costed with per-instruction models, evaluated at the extremes of their cells.
+
+import io
+import math
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import bfinterpreter.brainfuck as bf
+from bfinterpreter.tape import Tape
+from transpiler.dedup import DEDUP_OFF
+from transpiler.ir import Add, Cell, Input, Loop, Op, Output, Raw, adds, events
+from transpiler.old import CONSTANTS_SIZE
+from transpiler.parser import walk
+from transpiler.peephole import peephole
+from transpiler.transpiler import lower
+
+UNBOUNDED = "unbounded"  # a loop nothing bounds the passes of
+DATA_DEPENDENT = "data-dependent"  # the steps depend on the input
+COSTLY = "costly"  # may take more steps than the costly threshold
+COSTLY_STEPS = 100000
+# Passes followed one by one for a loop on a known cell that does not count it down
+_MAX_PASSES = 1 << 16
+_FULL = (0, 255)
+
+
+@dataclass
+class StatementEstimate:
+    """
+    The cost of one source line (line 0 for code without a line): size is the exact length of its code before
+    the peephole pass, min_steps and max_steps bound its steps over all inputs (max_steps is math.inf when a loop
+    is unbounded), and formula is its exact steps as a function of the values its variables hold when the line
+    starts, or None if its cost is not linear in them. flags are UNBOUNDED, DATA_DEPENDENT and COSTLY.
+    """
+    line: int
+    instr: str
+    source: str
+    size: int
+    min_steps: int
+    max_steps: float
+    formula: Optional[str]
+    flags: List[str]
+
+
+@dataclass
+class Estimate:
+    """
+    size and optimized_size: the length of the code before and after the peephole pass.
+    min_steps and max_steps bound the steps of the code before the peephole pass, summed over the statements.
+    """
+    size: int
+    optimized_size: int
+    min_steps: int
+    max_steps: float
+    statements: List[StatementEstimate]
+
+    def flagged(self, flag: str) -> List[StatementEstimate]:
+        return [statement for statement in self.statements if flag in statement.flags]
+
+
+def estimate(code: str, constants: str = CONSTANTS_SIZE, layout: bool = True, dedup: str = DEDUP_OFF,
+             costly: int = COSTLY_STEPS) -> Estimate:
+    """
+    Transpiles the code with the options of transpile() and estimates its cost without running it.
+    Statements that may take costly steps or more are flagged COSTLY.
+    """
+    ast, generator = lower(io.StringIO(code), constants, layout, dedup)
+    instrs = {}
+    for node in walk(ast):
+        if node.line:
+            instrs.setdefault(node.line, node.instr)
+    sizes = {}
+    for start, end, line in generator.source_map():
+        sizes[line] = sizes.get(line, 0) + end - start
+
+    analysis = _Analysis(generator.cells(), instrs)
+    analysis.ops(generator.ir())
+    costs = analysis.runs
+
+    sources = code.split("\n")
+    statements = []
+    for line in sorted(costs):
+        cost = _Cost()
+        for run in costs[line]:
+            cost = cost.plus(run)
+        # A formula in the values at the start of the line only holds for a line run once
+        formula = _formula(cost) if len(costs[line]) == 1 or not any(run.terms for run in costs[line]) else None
+        flags = [flag for flag, test in ((UNBOUNDED, cost.hi == math.inf), (DATA_DEPENDENT, cost.lo != cost.hi),
+                                         (COSTLY, cost.hi >= costly)) if test]
+        statements.append(StatementEstimate(line, instrs.get(line, ""),
+                                            sources[line - 1].strip() if 0 < line <= len(sources) else "",
+                                            sizes.get(line, 0), cost.lo, cost.hi, formula, flags))
+
+    program = generator.get_program()
+    return Estimate(len(program), len(peephole(program)[0]), sum(s.min_steps for s in statements),
+                    sum(s.max_steps for s in statements), statements)
+
+
+def format_estimate(result: Estimate) -> str:
+    """
+    Formats the estimate as a table of the statements, then the totals.
+    """
+    rows = ["{:>6} {:>8} {:>10} {:>10}  {:<24} {}".format("line", "size", "min steps", "max steps", "flags", "source")]
+    for s in result.statements:
+        rows.append("{:>6} {:>8} {:>10} {:>10}  {:<24} {}".format(
+            s.line or "-", s.size, s.min_steps, _count(s.max_steps), ",".join(s.flags), s.source))
+        if s.formula is not None and s.min_steps != s.max_steps:
+            rows.append("{:>39}  steps = {}".format("", s.formula))
+    rows.append("size: {} ({} optimized), steps: {} to {}".format(
+        result.size, result.optimized_size, result.min_steps, _count(result.max_steps)))
+    return "\n".join(rows)
+
+
+def _count(steps: float) -> str:
+    return "inf" if steps == math.inf else str(steps)
+
+
+def _formula(cost: '_Cost') -> Optional[str]:
+    if not cost.linear:
+        return None
+    return " + ".join([str(cost.const)] + ["{}*{}".format(coef, name) for name, coef in sorted(cost.terms.items())])
+
+
+class _Cost:
+    """
+    Steps between lo and hi; if linear, exactly const + sum(coef * value of name for name, coef in terms).
+    """
+    __slots__ = ("lo", "hi", "const", "terms", "linear")
+
+    def __init__(self, lo=0, hi=None, const=None, terms=None, linear=None):
+        self.lo = lo
+        self.hi = lo if hi is None else hi
+        self.const = lo if const is None else const
+        self.terms = terms or {}
+        self.linear = self.lo == self.hi if linear is None else linear
+
+    def plus(self, other: '_Cost') -> '_Cost':
+        terms = dict(self.terms)
+        for name, coef in other.terms.items():
+            terms[name] = terms.get(name, 0) + coef
+        return _Cost(self.lo + other.lo, self.hi + other.hi, self.const + other.const, terms,
+                     self.linear and other.linear)
+
+
+class _Analysis:
+    """
+    Walks the IR in program order, tracking the pointer and the range of values of each cell.
+    """
+    def __init__(self, cells: Dict[str, Tuple[int, int]], instrs: Dict[int, str]):
+        self.cells = cells
+        self.instrs = instrs
+        self.ranges = {}  # {cell: (lo, hi)}, cells missing are zero
+        self.names = {}  # {cell: variable} of the cells holding a variable's value at the start of the line
+        self.pointer = 0
+        self.runs = {}  # {line: [_Cost]} of each run of consecutive code of the line
+        self.line = None
+
+    def position(self, cell: Cell) -> int:
+        return self.cells[cell[0]][0] + cell[1]
+
+    def range(self, cell: Cell) -> Tuple[int, int]:
+        return self.ranges.get(cell, (0, 0))
+
+    def set_range(self, cell: Cell, r: Tuple[int, int]):
+        self.ranges[cell] = r if 0 <= r[0] and r[1] <= 255 else _FULL
+        self.names.pop(cell, None)
+
+    def start_line(self):
+        # Names the variables whose values are not known when a line starts, for formulas
+        self.names = {cell: cell[0] for cell, (lo, hi) in self.ranges.items()
+                      if lo != hi and not cell[0].startswith("__") and self.cells[cell[0]][1] - self.cells[cell[0]][0] == 1}
+
+    def ops(self, ops: List[Op]):
+        # Adds the cost of each op to its line, as the source map does: the moves to an op's cell belong to the
+        # op, and the code of a loop's body to the lines of its ops, except for loops costed as a whole
+        for op in ops:
+            if op.line != self.line:
+                self.start_line()
+            dst = self.position(op.cell)
+            steps = abs(dst - self.pointer)
+            self.pointer = dst
+            kind = type(op)
+            if kind is Add:
+                lo, hi = self.range(op.cell)
+                n = _signed(op.n)
+                self.set_range(op.cell, (lo + n, hi + n))
+                self._add_cost(op.line, _Cost(steps + len(adds(op.n))))
+            elif kind is Input:
+                self.set_range(op.cell, _FULL)
+                self._add_cost(op.line, _Cost(steps + 1))
+            elif kind is Output:
+                self._add_cost(op.line, _Cost(steps + 1))
+            elif kind is Raw:
+                self._add_cost(op.line, _Cost(steps).plus(self._raw(op)))
+            else:
+                self._add_cost(op.line, _Cost(steps))
+                self._loop(op)
+
+    def _add_cost(self, line: int, cost: _Cost):
+        runs = self.runs.setdefault(line, [])
+        if line != self.line or not runs:
+            runs.append(_Cost())
+            self.line = line
+        runs[-1] = runs[-1].plus(cost)
+
+    def _loop(self, loop: Loop):
+        lo, hi = self.range(loop.cell)
+        if hi == 0:
+            self._add_cost(loop.line, _Cost(1))
+        elif _counter(loop) is not None:
+            self._add_cost(loop.line, self._counter_loop(loop, _counter(loop)))
+        elif self.instrs.get(loop.line) in ("divmod", "div", "mod") and [type(op) for op in loop.body] == [Raw]:
+            self._add_cost(loop.line, self._divmod(loop))
+        elif lo == hi:
+            self._known_loop(loop)
+        elif _step(loop) is not None:
+            self._bounded_loop(loop, _step(loop))
+        else:
+            self._add_cost(loop.line, self._unbounded(loop))
+
+    def _counter_loop(self, loop: Loop, deltas: Dict[Cell, int]) -> _Cost:
+        # cell[adds cell-] runs once per unit of the cell (cell+ once per unit up to 256)
+        lo, hi = self.range(loop.cell)
+        down = deltas[loop.cell] == -1
+        passes = (lo, hi) if down else ((256 - hi, 256 - lo) if lo else (0, 255))
+        per_pass, pointer = 1, self.pointer
+        for op in loop.body:
+            per_pass += abs(self.position(op.cell) - pointer) + len(adds(op.n))
+            pointer = self.position(op.cell)
+        per_pass += abs(self.position(loop.cell) - pointer)
+
+        name = self.names.get(loop.cell) if down and lo != hi else None
+        if lo == hi:
+            cost = _Cost(1 + passes[0] * per_pass)
+        elif name is not None:
+            cost = _Cost(1 + passes[0] * per_pass, 1 + passes[1] * per_pass, 1, {name: per_pass}, True)
+        else:
+            cost = _Cost(1 + passes[0] * per_pass, 1 + passes[1] * per_pass)
+
+        for cell, k in deltas.items():
+            if cell != loop.cell:
+                tlo, thi = self.range(cell)
+                copy = name is not None and k == 1 and tlo == thi == 0
+                self.set_range(cell, (tlo + min(k * passes[0], k * passes[1]), thi + max(k * passes[0], k * passes[1])))
+                if copy:
+                    self.names[cell] = name
+        self.set_range(loop.cell, (0, 0))
+        return cost
+
+    def _known_loop(self, loop: Loop):
+        # Follows the passes while the loop cell stays known
+        self._add_cost(loop.line, _Cost(1))
+        for _ in range(_MAX_PASSES):
+            self.ops(loop.body)
+            dst = self.position(loop.cell)
+            self._add_cost(loop.line, _Cost(abs(dst - self.pointer) + 1))
+            self.pointer = dst
+            lo, hi = self.range(loop.cell)
+            if hi == 0:
+                return
+            if lo != hi:
+                break
+        self._add_cost(loop.line, self._unbounded(loop))
+
+    def _bounded_loop(self, loop: Loop, step: int):
+        # A loop counting its cell down (or up) by one with other loops in its body: one pass is costed from
+        # what is known whichever pass it is, and that cost is taken over the range of the passes
+        lo, hi = self.range(loop.cell)
+        passes = (lo, hi) if step == -1 else ((256 - hi, 256 - lo) if lo else (0, 255))
+        self._add_cost(loop.line, _Cost(1))
+        self._clobber(loop.body)
+        self.set_range(loop.cell, (1, hi) if step == -1 else (max(lo, 1), 255))
+        runs, line = self.runs, self.line
+        self.runs = {}
+        self.ops(loop.body)
+        dst = self.position(loop.cell)
+        self._add_cost(loop.line, _Cost(abs(dst - self.pointer) + 1))
+        self.pointer = dst
+        one_pass, self.runs, self.line = self.runs, runs, line
+        for body_line, costs in one_pass.items():
+            cost = _Cost()
+            for run in costs:
+                cost = cost.plus(run)
+            self._add_cost(body_line, _Cost(cost.lo * passes[0], cost.hi * passes[1], linear=False))
+        self._clobber(loop.body)
+        self.set_range(loop.cell, (0, 0))
+
+    def _unbounded(self, loop: Loop) -> _Cost:
+        # Nothing is known about the passes, nor about the cells the body writes afterwards
+        for line in {op.line for op, _, _ in events(loop.body)} - {loop.line}:
+            self._add_cost(line, _Cost(0, math.inf, linear=False))
+        self._clobber(loop.body)
+        self.set_range(loop.cell, (0, 0))
+        self.pointer = self.position(loop.cell)
+        return _Cost(0, math.inf, linear=False)
+
+    def _clobber(self, ops: List[Op]):
+        # Makes the cells the ops may write unknown
+        for op, _, _ in events(ops):
+            if type(op) is Raw:
+                start, end = self.cells[op.cell[0]]
+                for offset in range(end - start):
+                    self.set_range((op.cell[0], offset), _FULL)
+            elif type(op) in (Add, Input):
+                self.set_range(op.cell, _FULL)
+
+    def _divmod(self, loop: Loop) -> _Cost:
+        """
+        div_mod()'s loop runs once per unit of the dividend n, with a longer pass each time the divisor dsor
+        counts down to zero, which moves its remainder r back: 21*n + (n//dsor)*(5 + 9*dsor) steps for
+        dsor > 0, so between 21*n (no division) and 35*n (dsor 1).
+        """
+        name, offset = loop.cell
+        code = "[" + loop.body[0].code + "]"
+        a, b = self.range(loop.cell), self.range((name, offset + 1))
+        corners = (b[0], b[0]) if b[0] == b[1] else (0, 1)
+        lo = _simulate(code, {0: a[0], 1: corners[0]}, 6)
+        hi = _simulate(code, {0: a[1], 1: corners[1]}, 6)
+        for i, r in enumerate(((0, 0), _FULL, (0, 0), (0, 0), _FULL, _FULL)):
+            self.set_range((name, offset + i), r)
+        return _Cost(lo, hi)
+
+    def _raw(self, op: Raw) -> _Cost:
+        name, _ = op.cell
+        instr = self.instrs.get(op.line)
+        start, end = self.cells[name]
+        if instr not in ("lset", "lget"):
+            for offset in range(end - start):
+                self.set_range((name, offset), _FULL)
+            return _Cost(0, math.inf, linear=False)
+        # The carrier walk of lset() and lget() takes steps quadratic in the index plus the index times the
+        # value carried (see BrainfuckGenerator.lset()), so it grows with the index, the value and the data: it
+        # is run from the cells at their lowest, then at their highest. An index that may be past the list walks
+        # off it, with no bound. The cost is not linear, so these lines get no formula.
+        size = (end - start - 3) // 3
+        low = {k: self.range((name, k))[0] for k in range(end - start)}
+        high = {k: self.range((name, k))[1] for k in range(end - start)}
+        if high[3] >= size:
+            # Past the list the walk changes cells of other variables too
+            for other, (first, last) in self.cells.items():
+                for offset in range(last - first):
+                    self.set_range((other, offset), _FULL)
+            return _Cost(0, math.inf, linear=False)
+        cost = _Cost(_simulate(op.code, low, end - start), _simulate(op.code, high, end - start))
+
+        data = [(name, 5 + 3 * k) for k in range(size)]
+        value = (min(self.range(cell)[0] for cell in data), max(self.range(cell)[1] for cell in data))
+        for k in range(end - start):
+            if k % 3 != 2:
+                self.set_range((name, k), (0, 0))
+        if instr == "lget":
+            self.set_range((name, 4), value)
+        else:
+            for cell in data:
+                self.set_range(cell, _FULL)
+        return cost
+
+
+def _counter(loop: Loop) -> Optional[Dict[Cell, int]]:
+    # The signed adds of a loop whose body only adds, and adds 1 or -1 to the loop cell
+    if any(type(op) is not Add for op in loop.body):
+        return None
+    deltas = {}
+    for op in loop.body:
+        deltas[op.cell] = _signed(deltas.get(op.cell, 0) + op.n)
+    return deltas if deltas.get(loop.cell) in (1, -1) else None
+
+
+def _step(loop: Loop) -> Optional[int]:
+    # 1 or -1 if the loop's body adds that to the loop cell, and only its own ops change the loop cell
+    step = 0
+    for op in loop.body:
+        if type(op) is Add and op.cell == loop.cell:
+            step += op.n
+    for op, depth, _ in events(loop.body):
+        if op.cell == loop.cell and (depth or type(op) is not Add) or (type(op) is Raw and op.cell[0] == loop.cell[0]):
+            return None
+    step = _signed(step)
+    return step if step in (1, -1) else None
+
+
+def _signed(n: int) -> int:
+    n &= 0xff
+    return n if n <= 128 else n - 256
+
+
+def _simulate(code: str, values: Dict[int, int], size: int) -> int:
+    # The steps of raw code on cells with the values, for the cost models
+    tape = Tape(size)
+    for offset, value in values.items():
+        tape.cells[offset] = value
+    return bf.evaluate(code, io.StringIO(), io.StringIO(), engine="compiled", tape=tape)
@@ -0,0 +1,167 @@
+from typing import Callable, Iterable, Iterator, List, NamedTuple, TextIO, Tuple, Union
+
+# A cell, named by its variable (or temp) and its offset in the variable, so the IR does not depend on the layout
+Cell = Tuple[str, int]
+# Each op also has the source line of the instruction it was lowered from (0 if unknown)
+# Pieces of code joined per write when streaming
+_BUFFER_CHUNKS = 4096
+
+
+class Add(NamedTuple):
+    """
+    Adds n (mod 256) to the cell.
+    """
+    cell: Cell
+    n: int
+    line: int = 0
+
+
+class Loop(NamedTuple):
+    """
+    Runs the body while the cell is not zero. The body starts and ends with the pointer on the cell.
+    """
+    cell: Cell
+    body: list
+    line: int = 0
+
+
+class Input(NamedTuple):
+    """
+    Reads a char into the cell.
+    """
+    cell: Cell
+    line: int = 0
+
+
+class Output(NamedTuple):
+    """
+    Writes the cell as a char.
+    """
+    cell: Cell
+    line: int = 0
+
+
+class Raw(NamedTuple):
+    """
+    Brainfuck code that starts and ends with the pointer on the cell and addresses the cells relative to it.
+    """
+    cell: Cell
+    code: str
+    line: int = 0
+
+
+Op = Union[Add, Loop, Input, Output, Raw]
+
+
+def events(ir: List[Op]) -> Iterator[Tuple[Op, int, bool]]:
+    """
+    Yields (op, loop depth, end) for the ops of the IR in program order, without recursion.
+    A loop is yielded twice: at its start with end False and after its body with end True.
+    """
+    stack = [(iter(ir), None)]
+    while stack:
+        ops, loop = stack[-1]
+        op = next(ops, None)
+        if op is None:
+            stack.pop()
+            if loop is not None:
+                yield loop, len(stack) - 1, True
+            continue
+        yield op, len(stack) - 1, False
+        if type(op) is Loop:
+            stack.append((iter(op.body), op))
+
+
+def moves(ir: List[Op], position: Callable[[Cell], int]) -> Iterator[Tuple[int, int, int]]:
+    """
+    Yields the pointer moves of the IR, with the cells at position(cell), as (from, to, loop depth).
+    The pointer starts on cell 0.
+    """
+    pos = 0
+    for op, depth, _ in events(ir):
+        dst = position(op.cell)
+        if dst != pos:
+            yield pos, dst, depth
+            pos = dst
+
+
+def chunks(ir: List[Op], position: Callable[[Cell], int]) -> Iterator[str]:
+    """
+    Yields the brainfuck code of the IR in pieces, with the cells at position(cell) and the pointer starting
+    on cell 0. Moves are emitted before each op to reach its cell.
+    """
+    for chunk, _ in _pieces(ir, position):
+        yield chunk
+
+
+def source_map(ir: List[Op], position: Callable[[Cell], int]) -> List[Tuple[int, int, int]]:
+    """
+    Returns the spans of the emitted code (see chunks()) by source line, as [(start, end, line)] in order.
+    The moves to an op's cell belong to the op, and a loop's closing bracket to the loop.
+    """
+    spans = []
+    start = 0
+    for chunk, line in _pieces(ir, position):
+        end = start + len(chunk)
+        if spans and spans[-1][2] == line:
+            spans[-1] = (spans[-1][0], end, line)
+        else:
+            spans.append((start, end, line))
+        start = end
+    return spans
+
+
+def adds(n: int) -> str:
+    """
+    Returns the shortest code adding n (mod 256) to a cell.
+    """
+    n &= 0xff
+    return '+' * n if n <= 128 else '-' * (256 - n)
+
+
+def _pieces(ir: List[Op], position: Callable[[Cell], int]) -> Iterator[Tuple[str, int]]:
+    pos = 0
+    for op, _, end in events(ir):
+        dst = position(op.cell)
+        if dst != pos:
+            yield '>' * (dst - pos) if pos < dst else '<' * (pos - dst), op.line
+            pos = dst
+        kind = type(op)
+        if kind is Add:
+            yield adds(op.n), op.line
+        elif kind is Loop:
+            yield ']' if end else '[', op.line
+        elif kind is Output:
+            yield '.', op.line
+        elif kind is Input:
+            yield ',', op.line
+        else:
+            yield op.code, op.line
+
+
+def emit(ir: List[Op], position: Callable[[Cell], int]) -> str:
+    """
+    Returns the brainfuck code of the IR (see chunks()), joined once.
+    """
+    return "".join(chunks(ir, position))
+
+
+def write(ir: List[Op], position: Callable[[Cell], int], stream: TextIO, buffer: int = _BUFFER_CHUNKS):
+    """
+    Writes the brainfuck code of the IR (see chunks()) to the stream, joining buffer pieces per write,
+    so the whole program is never held as one string.
+    """
+    write_chunks(chunks(ir, position), stream, buffer)
+
+
+def write_chunks(pieces: Iterable[str], stream: TextIO, buffer: int = _BUFFER_CHUNKS):
+    """
+    Writes the pieces of code to the stream, joining buffer pieces per write.
+    """
+    pending = []
+    for chunk in pieces:
+        pending.append(chunk)
+        if len(pending) == buffer:
+            stream.write("".join(pending))
+            pending.clear()
+    stream.write("".join(pending))
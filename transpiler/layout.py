@@ -0,0 +1,175 @@
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from transpiler.old import BrainfuckGenerator
+
+# Weight of a pointer move per enclosing loop, as moves in loops run many times
+LOOP_WEIGHT = 8
+# Passes of the local search over the order of the variables
+_MAX_PASSES = 8
+# Bound on variables * (variables + co-access edges) over all passes, roughly the work of the local search;
+# larger programs get fewer passes, or none
+_SEARCH_BUDGET = 1 << 17
+
+
+@dataclass
+class LayoutStats:
+    """
+    travel: number of pointer moves emitted.
+    cost: pointer moves weighted by LOOP_WEIGHT per enclosing loop.
+    Before is with the cells in declaration order, after is with the chosen layout (the same if it was kept).
+    """
+    travel_before: int
+    travel_after: int
+    cost_before: int
+    cost_after: int
+
+
+def plan_layout(generate: Callable[[Optional[Dict[str, int]]], BrainfuckGenerator]) -> Tuple[BrainfuckGenerator, LayoutStats]:
+    """
+    Reorders the cells of the temps and variables to minimise pointer travel.
+    generate(layout) runs the code generator with a {name: start cell} layout (None for declaration order).
+    The moves of a first run give a co-access graph of the cells, weighted by loop depth, which is laid out
+    again to minimise the weighted distance between cells accessed one after the other.
+    Returns the generator of whichever run had the lower cost, with the travel of both.
+    """
+    before = generate(None)
+    sizes = {name: end - start for name, (start, end) in before.cells().items()}
+    graph = co_access_graph(before.seeks(), before.cells())
+    after = generate(_layout(_order(sizes, graph), sizes))
+
+    travel_before, cost_before = travel(before.seeks())
+    travel_after, cost_after = travel(after.seeks())
+    if (cost_after, travel_after) >= (cost_before, travel_before):
+        return before, LayoutStats(travel_before, travel_before, cost_before, cost_before)
+    return after, LayoutStats(travel_before, travel_after, cost_before, cost_after)
+
+
+def travel(seeks: List[Tuple[int, int, int]]) -> Tuple[int, int]:
+    """
+    Returns the number of pointer moves and their cost weighted by loop depth.
+    """
+    moves = cost = 0
+    for src, dst, depth in seeks:
+        moves += abs(dst - src)
+        cost += abs(dst - src) * LOOP_WEIGHT ** depth
+    return moves, cost
+
+
+def co_access_graph(seeks: List[Tuple[int, int, int]], cells: Dict[str, Tuple[int, int]]) -> Dict[tuple, int]:
+    """
+    Returns {((name, offset), (name, offset)): weight} of the pointer moves between cells of different variables
+    (or temps), each weighted by loop depth, where offset is the position of the cell in its variable.
+    """
+    owners = {}
+    for name, (start, end) in cells.items():
+        for cell in range(start, end):
+            owners[cell] = (name, cell - start)
+
+    graph = defaultdict(int)
+    for src, dst, depth in seeks:
+        a, b = owners.get(src), owners.get(dst)
+        if a is None or b is None or a[0] == b[0]:
+            continue
+        graph[min(a, b), max(a, b)] += LOOP_WEIGHT ** depth
+    return dict(graph)
+
+
+def _starts(order: List[str], sizes: Dict[str, int]) -> Dict[str, int]:
+    starts, start = {}, 0
+    for name in order:
+        starts[name] = start
+        start += sizes[name]
+    return starts
+
+
+def _order(sizes: Dict[str, int], graph) -> List[str]:
+    """
+    Orders the variables greedily, each next to the placed ones it is most connected to,
+    then improves the order by moving single variables while that lowers the cost, for as many passes
+    as _SEARCH_BUDGET allows.
+    """
+    links = defaultdict(int)
+    for (a, b), weight in graph.items():
+        links[a[0], b[0]] += weight
+        links[b[0], a[0]] += weight
+
+    remaining = list(sizes)
+    order = [max(remaining, key=lambda name: sum(links[name, other] for other in sizes))]
+    remaining.remove(order[0])
+    while remaining:
+        name = max(remaining, key=lambda name: sum(links[name, placed] for placed in order))
+        remaining.remove(name)
+        # Place it at whichever end is closer to the variables it is connected to
+        head = sum(links[name, placed] * (len(order) - i) for i, placed in enumerate(order))
+        tail = sum(links[name, placed] * (i + 1) for i, placed in enumerate(order))
+        if head < tail:
+            order.insert(0, name)
+        else:
+            order.append(name)
+
+    edges = _edges(graph)
+    passes = min(_MAX_PASSES, _SEARCH_BUDGET // (len(sizes) * (len(sizes) + len(graph))))
+    for _ in range(passes):
+        improved = False
+        for name in list(order):
+            position = _best_position(order, name, sizes, edges)
+            if position is not None:
+                order.remove(name)
+                order.insert(position, name)
+                improved = True
+        if not improved:
+            break
+    return order
+
+
+def _edges(graph) -> Dict[str, list]:
+    # The co-access edges of each variable, as [(offset, other variable, its offset, weight)]
+    edges = defaultdict(list)
+    for (a, b), weight in graph.items():
+        edges[a[0]].append((a[1], b[0], b[1], weight))
+        edges[b[0]].append((b[1], a[0], a[1], weight))
+    return edges
+
+
+def _best_position(order: List[str], name: str, sizes: Dict[str, int], edges) -> Optional[int]:
+    """
+    Returns the position to move name to (an index in the order without it) that lowers the cost the most,
+    the first one if several do, or None if no position is cheaper than its own.
+    Moving name past a neighbour only moves the two of them, so the cost of each position follows from that
+    of the one before through their edges alone: name is walked to the front, then to the back.
+    """
+    starts = _starts(order, sizes)
+
+    def pair_cost(other):
+        total = 0
+        for offset, peer, peer_offset, weight in edges[name]:
+            total += weight * abs(starts[name] + offset - starts[peer] - peer_offset)
+        for offset, peer, peer_offset, weight in edges[other]:
+            if peer != name:
+                total += weight * abs(starts[other] + offset - starts[peer] - peer_offset)
+        return total
+
+    index = order.index(name)
+    rest = order[:index] + order[index + 1:]
+    costs = [0] * len(order)
+    cost = 0
+    for i in range(index - 1, -1, -1):
+        before = pair_cost(rest[i])
+        starts[name], starts[rest[i]] = starts[rest[i]], starts[rest[i]] + sizes[name]
+        cost += pair_cost(rest[i]) - before
+        costs[i] = cost
+    cost = costs[0]
+    for i in range(len(rest)):
+        before = pair_cost(rest[i])
+        starts[rest[i]], starts[name] = starts[name], starts[name] + sizes[rest[i]]
+        cost += pair_cost(rest[i]) - before
+        if i + 1 > index:
+            costs[i + 1] = cost
+    best = min(range(len(costs)), key=costs.__getitem__)
+    return best if costs[best] < costs[index] else None
+
+
+def _layout(order: List[str], sizes: Dict[str, int]) -> Dict[str, int]:
+    return _starts(order, sizes)
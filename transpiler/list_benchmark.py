@@ -0,0 +1,73 @@
+# List Access Benchmark
+# Measures the steps one lset/lget takes, for lists of several sizes, with the
+# index as a variable (the carrier walk) and as a literal (a direct write). The walk
+# takes steps quadratic in the index, see BrainfuckGenerator.lset().
+#
+# Usage: python -m transpiler.list_benchmark [SIZE ...]
+
+import io
+import sys
+from dataclasses import dataclass
+from typing import List
+
+import bfinterpreter.brainfuck as bf
+from transpiler.transpiler import transpile
+
+SIZES = (10, 25, 50, 100, 200)
+# Indices measured per list, spread evenly over the list
+_SAMPLES = 10
+_VALUE = 100
+
+
+@dataclass
+class ListAccess:
+    """
+    Steps per access to a list of size elements, averaged over indices spread over the list,
+    and at the last index; lset stores a variable, literal_lset a literal at a literal index.
+    """
+    size: int
+    lset_mean: float
+    lset_last: int
+    lget_mean: float
+    lget_last: int
+    literal_lset: int
+    literal_lget: int
+
+
+def measure(size: int) -> ListAccess:
+    indices = sorted({size * i // _SAMPLES for i in range(_SAMPLES)} | {size - 1})
+    lsets = [_access_steps(size, "set i {}\nset v {}\nlset l i v".format(index, _VALUE)) for index in indices]
+    lgets = [_access_steps(size, "set i {}\nlget l i x".format(index)) for index in indices]
+    literal_lset = _access_steps(size, "lset l {} {}".format(size - 1, _VALUE))
+    literal_lget = _access_steps(size, "lget l {} x".format(size - 1))
+    return ListAccess(size, sum(lsets) / len(lsets), lsets[-1], sum(lgets) / len(lgets), lgets[-1], literal_lset, literal_lget)
+
+
+def _access_steps(size: int, access: str) -> int:
+    # Steps of the access, less those of the same program without it (declaring and setting i)
+    head = "var l[{}] i v x\nread x\nlset l x x\n".format(size)
+    setup = "\n".join(line for line in access.split("\n") if not line.startswith(("lset", "lget")))
+    return _steps(head + access) - _steps(head + setup)
+
+
+def _steps(code: str) -> int:
+    # Reading x and a lset by x keep the list indexed by a variable and its contents unknown to the generator
+    return bf.evaluate(transpile(code), instream=io.StringIO("\x00"), outstream=io.StringIO())
+
+
+def format_results(results: List[ListAccess]) -> str:
+    rows = ["{:>6} {:>10} {:>10} {:>10} {:>10} {:>12} {:>12}".format(
+        "size", "lset mean", "lset last", "lget mean", "lget last", "lset 'size'", "lget 'size'")]
+    for r in results:
+        rows.append("{:>6} {:>10.0f} {:>10} {:>10.0f} {:>10} {:>12} {:>12}".format(
+            r.size, r.lset_mean, r.lset_last, r.lget_mean, r.lget_last, r.literal_lset, r.literal_lget))
+    return "\n".join(rows)
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or SIZES
+    print(format_results([measure(size) for size in sizes]))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,23 @@
 import re
+from functools import lru_cache
+
+from transpiler.ir import Add, Loop, Input, Output, Raw, adds, chunks, emit, moves, source_map, write
+
+# How literals are emitted: always as a run of '+'/'-', or as the shortest code, or as the fewest steps
+# (a multiplication loop on a scratch cell is used when it wins)
+CONSTANTS_LINEAR, CONSTANTS_SIZE, CONSTANTS_STEPS = "linear", "size", "steps"
+# Smallest delta that a scratch loop can emit in fewer characters than a run
+_FACTORED_MIN = 13
 
 
 class Var:
-    def __init__(self, name, size=1):
+    def __init__(self, name, size=1, indexed=False):
+        """
+        indexed: the variable is a list that is indexed by variables (not only literals), see lset().
+        """
         self.name = name
         self.size = size
+        self.indexed = indexed
 
 
 class Translator:
@@ -100,27 +113,124 @@ class Translator:
 
 class BrainfuckGenerator:
     class Tape:
-        def __init__(self):
-            self._pos = 0
-
-        def seek(self, pos):
-            r = "" + '>' * (pos - self._pos) + '<' * (self._pos - pos)
-            self._pos = pos
-            return r
-
-        def write(self, v, pos=None):
-            r = ""
-            if pos:
-                r += self.seek(pos)
-            r += "[-]" + "+" * v
-            return r
+        """
+        Lowers cell operations to IR (see transpiler.ir) and tracks the pointer position and the known cell values,
+        so writes are emitted as the shortest delta. Cells are (name, offset) and position(cell) is their index.
+        Cells start at zero. Inside a loop nothing is known about the cells; when a loop ends, the cells
+        written in its body become unknown and the loop cell is zero.
+        With a scratch function, which returns a free cell near a given cell (or None), literals may be built
+        with a multiplication loop on that cell, per the constants strategy.
+        Ops are tagged with the line attribute, the source line being lowered.
+        """
+        def __init__(self, position, constants=CONSTANTS_SIZE, scratch=None):
+            self.position = position
+            self.constants = constants
+            self.scratch = scratch
+            self.ir = []
+            self.line = 0  # source line of the ops appended
+            self._block = self.ir  # ops of the innermost open loop
+            self._cell = None
+            self._values = {}  # {cell: value, or None if unknown}
+            self._all_zero = True  # whether cells missing from _values are zero
+            self._loops = []  # [(loop, block, values, all_zero, written)] saved at each enclosing loop start
+            self._written = set()
+
+        def value(self, cell=None):
+            cell = cell or self._cell
+            if cell in self._values:
+                return self._values[cell]
+            return 0 if self._all_zero else None
+
+        def write(self, v, cell=None):
+            cell = cell or self._cell
+            v &= 0xff
+            known = self.value(cell)
+            if known is None:
+                self._append(Loop(cell, [Add(cell, -1, self.line)], self.line))
+                known = 0
+            self._constant(v - known, cell)
+            self._set(cell, v)
+
+        def add(self, delta, cell=None):
+            cell = cell or self._cell
+            known = self.value(cell)
+            self._constant(delta, cell)
+            self._set(cell, None if known is None else (known + delta) & 0xff)
+
+        def read(self, cell=None):
+            cell = cell or self._cell
+            self._append(Input(cell, self.line))
+            self._set(cell, None)
+
+        def output(self, cell=None):
+            self._append(Output(cell or self._cell, self.line))
+
+        def raw(self, code, cell=None):
+            # Code that starts and ends on the cell; the cells it changes must be clobbered
+            self._append(Raw(cell or self._cell, code, self.line))
+
+        def clobber(self, cells, value=None):
+            # Marks cells changed by raw code as unknown, or as holding value
+            for cell in cells:
+                self._values[cell] = value
+                self._written.add(cell)
+
+        def loop_start(self, cell=None):
+            loop = Loop(cell or self._cell, [], self.line)
+            self._append(loop)
+            self._loops.append((loop, self._block, self._values, self._all_zero, self._written))
+            self._block, self._values, self._all_zero, self._written = loop.body, {}, False, set()
+
+        def loop_end(self):
+            # The body ends with the pointer back on the loop cell
+            written = self._written
+            loop, self._block, self._values, self._all_zero, self._written = self._loops.pop()
+            self.clobber(written)
+            self._cell = loop.cell
+            self._set(loop.cell, 0)
+
+        def _constant(self, delta, cell):
+            # Adds delta to the cell, with a scratch*factor+rest loop if the strategy prefers it
+            if self.constants == CONSTANTS_LINEAR or self.scratch is None or min(delta & 0xff, -delta & 0xff) < _FACTORED_MIN:
+                return self._add(delta, cell)
+            scratch = self.scratch(cell)
+            if scratch is None or scratch == cell:
+                return self._add(delta, cell)
+            pos, scratch_pos = self.position(cell), self.position(scratch)
+            current = self.position(self._cell) if self._cell else 0
+            detour = abs(current - scratch_pos) - abs(current - pos)
+            form = _factored_form(delta & 0xff, abs(pos - scratch_pos), detour, self.value(scratch), self.constants)
+            if form is None:
+                return self._add(delta, cell)
+
+            count, factor, rest = form
+            self.write(count, scratch)
+            self.loop_start(scratch)
+            self._add(factor, cell)
+            self._add(-1, scratch)
+            self.clobber((cell, scratch))
+            self.loop_end()
+            self._add(rest, cell)
+
+        def _add(self, delta, cell):
+            if delta & 0xff:
+                self._append(Add(cell, delta & 0xff, self.line))
+
+        def _append(self, op):
+            self._block.append(op)
+            self._cell = op.cell
+
+        def _set(self, cell, v):
+            self._values[cell] = v
+            self._written.add(cell)
 
     class VarTable:
         _MIN = 0
-        _MAX = 1024
+        _MAX = 1 << 16
 
         def __init__(self):
             self._vars = {}  # {(name: (start, end), name: (start, end)}
+            self._aliases = {}  # {name: (varname, offset)}
             self._free = [(self._MIN, self._MAX)]  # [(start, end), (start, end)]
 
         def alloc(self, name, size):
@@ -136,6 +246,16 @@ class BrainfuckGenerator:
                     return
             raise RuntimeError("Out of memory declaring variable {}".format(name))
 
+        def alloc_at(self, name, start, size):
+            if name in self._vars:
+                raise RuntimeError("Redeclaration of variable {}".format(name))
+            for i, block in enumerate(self._free):
+                if block[0] <= start and start + size <= block[1]:
+                    self._vars[name] = (start, start + size)
+                    self._free[i:i + 1] = [b for b in ((block[0], start), (start + size, block[1])) if b[0] < b[1]]
+                    return
+            raise RuntimeError("Cells {} to {} are not free for variable {}".format(start, start + size - 1, name))
+
         def free(self, name):
             if name not in self._vars:
                 raise RuntimeError("Variable {} does not exist".format(name))
@@ -158,82 +278,211 @@ class BrainfuckGenerator:
                 self._free[i + 1] = (self._free[i][0], self._free[i + 1][1])
                 self._free.pop(i)
 
+        def alias(self, name, varname, offset):
+            # Names a cell within a variable
+            self._aliases[name] = (varname, offset)
+
+        def cell(self, varname):
+            # The (name, offset) of the first cell of a variable, or of an aliased cell
+            return self._aliases.get(varname, (varname, 0))
+
+        def position(self, cell):
+            return self._vars[cell[0]][0] + cell[1]
+
         def pos(self, varname):
-            return self._vars[varname][0]
+            return self.position(self.cell(varname))
 
-    def __init__(self):
-        self._program = ""
-        self._tape = self.Tape()
+        def cells(self):
+            return dict(self._vars)
+
+    def __init__(self, constants=CONSTANTS_SIZE, layout=None):
+        """
+        constants: CONSTANTS_LINEAR, CONSTANTS_SIZE or CONSTANTS_STEPS, how literals are emitted.
+        layout: {name: start cell} for the temps and variables; cells are allocated in order of declaration
+        for names not in it.
+        Temps are only live within the instruction that acquires them, so their cells are shared between
+        instructions: a temp reuses the free temp cell closest to the variables it works with, and a new cell is
+        allocated only when all are live, so the program gets as many temp cells as its peak demand.
+        """
         self._var_table = self.VarTable()
-        self._var_table.alloc("__out__", 1)
-        self._var_table.alloc("__t0__", 1)
-        self._var_table.alloc("__t1__", 1)
-        self._var_table.alloc("__t2__", 1)
-        self._var_table.alloc("__t3__", 1)
-        self._var_table.alloc("__t4__", 1)
-        self._var_table.alloc("__t5__", 1)
-        self._var_table.alloc("__t6__", 1)
-        self._var_table.alloc("__t7__", 1)
+        self._tape = self.Tape(self._var_table.position, constants, self._scratch)
+        self._layout = layout or {}
+        self._temps = {}  # {size: [name]}
+        self._live = set()
+        self._dispatches = []  # [(loop, pending, flags)] of the enclosing dispatch loops
+        self._indexed = {}  # {name: size} of the lists indexed by variables
+        self._alloc("__out__", 1)
 
     def get_program(self):
-        return self._program
+        return emit(self._tape.ir, self._var_table.position)
+
+    def source_map(self):
+        """
+        Returns the spans of get_program() by source line, as [(start, end, line)] (see source()).
+        """
+        return source_map(self._tape.ir, self._var_table.position)
+
+    def source(self, line):
+        """
+        Sets the source line of the instructions generated next (0 if unknown).
+        """
+        self._tape.line = line
+
+    def write_to(self, stream):
+        """
+        Writes the program to the text stream as it is emitted, without building it as one string.
+        """
+        write(self._tape.ir, self._var_table.position, stream)
+
+    def chunks(self):
+        """
+        Yields the program in pieces as it is emitted (see transpiler.ir.chunks()).
+        """
+        return chunks(self._tape.ir, self._var_table.position)
+
+    def ir(self):
+        """
+        Returns the IR of the instructions generated so far (see transpiler.ir).
+        """
+        return self._tape.ir
+
+    def cells(self):
+        """
+        Returns {name: (start, end)} of the allocated cells.
+        """
+        return self._var_table.cells()
+
+    def state(self):
+        """
+        Returns what the code generated next depends on besides the instructions, between two top-level
+        instructions: the pointer's cell, the known cell values and the allocated cells and temps.
+        The state is hashable, so the IR generated from it can be kept by it and replayed (see replay()).
+        """
+        tape, table = self._tape, self._var_table
+        return (tape._cell, tape._all_zero, tuple(sorted(tape._values.items())), tuple(sorted(table._vars.items())),
+                tuple(table._free), tuple((size, tuple(names)) for size, names in sorted(self._temps.items())),
+                frozenset(self._live))
+
+    def replay(self, ops, state):
+        """
+        Appends ops that another generator generated from the current state(), and takes the state it ended in.
+        """
+        assert not self._tape._loops
+        tape, table = self._tape, self._var_table
+        tape.ir.extend(ops)
+        cell, tape._all_zero, values, cells, free, temps, live = state
+        tape._cell, tape._values = cell, dict(values)
+        table._vars, table._free = dict(cells), list(free)
+        self._temps = {size: list(names) for size, names in temps}
+        self._live = set(live)
+
+    def seeks(self):
+        """
+        Returns the pointer moves emitted so far as [(from cell, to cell, loop depth)].
+        """
+        return list(moves(self._tape.ir, self._var_table.position))
 
     def declare_vars(self, args):
         assert 0 < len(args)
         for var in args:
-            self._var_table.alloc(var.name, var.size)
+            if var.indexed:
+                # A header triple then a (carrier, value, data) triple per element, see lset()
+                self._alloc(var.name, 3 * var.size + 3)
+                for name, offset in (("h", 0), ("i", 3), ("v", 4)):
+                    self._var_table.alias("{}[{}]".format(var.name, name), var.name, offset)
+                self._indexed[var.name] = var.size
+            else:
+                self._alloc(var.name, var.size)
+
+    def _alloc(self, name, size):
+        if name in self._layout:
+            self._var_table.alloc_at(name, self._layout[name], size)
+        else:
+            self._var_table.alloc(name, size)
+
+    def _acquire(self, near, size=1):
+        """
+        Returns a temp of size cells that is not live and is closest to the variables in near.
+        Literals in near are ignored.
+        """
+        free = [name for name in self._temps.get(size, []) if name not in self._live]
+        if free:
+            positions = [self._var_table.pos(var) for var in near if self._get_literal(var) is None]
+            name = min(free, key=lambda temp: sum(abs(self._var_table.pos(temp) - pos) for pos in positions))
+        else:
+            name = "__t{}__".format(sum(len(temps) for temps in self._temps.values()))
+            self._alloc(name, size)
+            self._temps.setdefault(size, []).append(name)
+        self._live.add(name)
+        return name
+
+    def _release(self, *names):
+        self._live.difference_update(names)
+
+    def _scratch(self, cell):
+        # The free single cell temp closest to the cell, for the tape to build literals with
+        free = [name for name in self._temps.get(1, []) if name not in self._live]
+        if not free:
+            if self._temps.get(1):
+                return None
+            self._release(self._acquire([]))
+            free = self._temps[1]
+        pos = self._var_table.position(cell)
+        return min((self._var_table.cell(name) for name in free), key=lambda temp: abs(self._var_table.position(temp) - pos))
 
     def read_input(self, args):
         assert 1 == len(args)
-        pos = self._var_table.pos(args[0])
-        self._program += self._tape.seek(pos) + ","
+        self._tape.read(self._cell(args[0]))
 
     def print_output(self, args):
         for arg in args:
             if arg.startswith("\""):
                 if not arg.endswith("\""):
                     raise RuntimeError()
-                self._program += self._tape.seek(self._var_table.pos("__out__"))
-                for c in arg[1:-1]:
-                    self._program += self._tape.write(ord(c)) + "."
+                for c in self._unescape(arg[1:-1]):
+                    self._tape.write(ord(c), self._cell("__out__"))
+                    self._tape.output(self._cell("__out__"))
             else:
-                self._program += self._tape.seek(self._var_table.pos(arg)) + "."
+                self._tape.output(self._cell(arg))
 
     def _zero_var(self, var):
-        self._program += self._tape.write(0, self._var_table.pos(var))
+        self._tape.write(0, self._cell(var))
 
-    def _seek_to_var(self, var, inplace=False):
-        code = self._tape.seek(self._var_table.pos(var))
-        if inplace:
-            self._program += code
-        else:
-            return code
+    def _write_to_var(self, val, var):
+        self._tape.write(val, self._cell(var))
 
-    def _write_to_var(self, val, var, inplace=False):
-        code = self._tape.write(val, self._var_table.pos(var))
-        if inplace:
-            self._program += code
-        else:
-            return code
+    def _cell(self, var):
+        return self._var_table.cell(var)
+
+    def _loop(self, var, targets):
+        """
+        Emits var[targets+ var-], adding var times each (target, factor) and leaving var zero.
+        """
+        self._tape.loop_start(self._cell(var))
+        for target, factor in targets:
+            self._tape.add(factor, self._cell(target))
+        self._tape.add(-1, self._cell(var))
+        self._tape.loop_end()
 
     def set_var(self, args):
         assert 2 == len(args)
         a, b = args
-        t0 = "__t0__"
         literal = self._get_literal(b)
-        if literal:
-            self._write_to_var(literal, a, inplace=True)
-        else:
+        if literal is not None:
+            self._write_to_var(literal, a)
+        elif a != b:
             """
             t0[-]
             a[-]
             b[a+t0+b-]
             t0[b+t0-]
             """
+            t0 = self._acquire([a, b])
             self._zero_var(t0)
             self._zero_var(a)
-            self._program += self._seek_to_var(b) + "[" + self._seek_to_var(a) + "+" + self._seek_to_var(t0) + "+" + self._seek_to_var(b) + "-" + "]"
-            self._program += self._seek_to_var(t0) + "[" + self._seek_to_var(b) + "+" + self._seek_to_var(t0) + "-" + "]"
+            self._loop(b, [(a, 1), (t0, 1)])
+            self._loop(t0, [(b, 1)])
+            self._release(t0)
 
     def inc_var(self, args):
         self._delta_var(args)
@@ -244,45 +493,61 @@ class BrainfuckGenerator:
     def _delta_var(self, args, sign="+"):
         assert 2 == len(args)
         a, b = args
-        t0 = "__t0__"
-        not_sign = "-" if sign == "+" else "+"
+        factor = 1 if sign == "+" else -1
         literal = self._get_literal(b)
-        if literal:
-            self._program += self._seek_to_var(a) + sign * literal + not_sign * -literal
+        if literal is not None:
+            self._tape.add(factor * literal, self._cell(a))
+        elif a == b:
+            # The loop below would drain a while adding to it, so it counts down a copy instead
+            t0 = self._acquire([a])
+            self.set_var([t0, a])
+            self._loop(t0, [(a, factor)])
+            self._release(t0)
         else:
             """
             t0[-]
             b[a(sign)t0+b-]
             t0[b+t0-]
             """
+            t0 = self._acquire([a, b])
             self._zero_var(t0)
-            self._program += self._seek_to_var(b) + "[" + self._seek_to_var(a) + sign + self._seek_to_var(t0) + "+" + self._seek_to_var(b) + "-" + "]"
-            self._program += self._seek_to_var(t0) + "[" + self._seek_to_var(b) + "+" + self._seek_to_var(t0) + "-" + "]"
+            self._loop(b, [(a, factor), (t0, 1)])
+            self._loop(t0, [(b, 1)])
+            self._release(t0)
 
     def add(self, args):
         assert 3 == len(args)
         a, b, c = args
-        t1 = "__t1__"
+        t1 = self._acquire([a, b, c])
         self._zero_var(t1)
         self.inc_var([t1, a])
         self.inc_var([t1, b])
         self._zero_var(c)
         self.inc_var([c, t1])
+        self._release(t1)
 
     def sub(self, args):
         assert 3 == len(args)
         a, b, c = args
-        t1 = "__t1__"
+        t1 = self._acquire([a, b, c])
         self._zero_var(t1)
         self.inc_var([t1, a])
         self.dec_var([t1, b])
         self._zero_var(c)
         self.inc_var([c, t1])
+        self._release(t1)
 
     def mul(self, args):
         assert 3 == len(args)
         a, b, c = args
-        t1 = "__t1__"
+        x, y = self._get_literal(a), self._get_literal(b)
+        if x is not None and y is not None:
+            self._write_to_var(x * y, c)
+            return
+        if x is not None or a in (b, c) or b == c:
+            self._mul_copy(a, b, c)
+            return
+        t1 = self._acquire([a, b, c])
         """
         c[-]
         t1[-]
@@ -293,65 +558,245 @@ class BrainfuckGenerator:
         """
         self._zero_var(c)
         self._zero_var(t1)
-        self._program += self._seek_to_var(a) + "[" + self._seek_to_var(t1) + "+" + self._seek_to_var(a) + "-]"
-        self._program += self._seek_to_var(t1) + "["
+        self._loop(a, [(t1, 1)])
+        self._tape.loop_start(self._cell(t1))
         self.inc_var([c, b])
-        self._program += self._seek_to_var(a) + "+" + self._seek_to_var(t1) + "-]"
+        self._tape.add(1, self._cell(a))
+        self._tape.add(-1, self._cell(t1))
+        self._tape.loop_end()
+        self._release(t1)
+
+    def _mul_copy(self, a, b, c):
+        """
+        mul for a literal a or aliased operands: a is copied rather than moved and restored, and the product is
+        summed in a temp when c is also an operand.
+        _set_var(t1, a)_
+        t2[-]
+        t1[
+          _inc(t2, b)_
+          t1-]
+        _set_var(c, t2)_
+        """
+        t1 = self._acquire([a, b, c])
+        self.set_var([t1, a])
+        t2 = self._acquire([b, c]) if c in (a, b) else c
+        self._zero_var(t2)
+        self._tape.loop_start(self._cell(t1))
+        self.inc_var([t2, b])
+        self._tape.add(-1, self._cell(t1))
+        self._tape.loop_end()
+        if t2 != c:
+            self._zero_var(c)
+            self._loop(t2, [(c, 1)])
+            self._release(t2)
+        self._release(t1)
 
     def div_mod(self, args):
         assert 4 == len(args)
         a, b, c, d = args
-        zero, q, r, ddend, dsor, end = "__t2__", "__t3__", "__t4__", "__t5__", "__t6__", "__t7__"
+        block = self._acquire([a, b, c, d], size=6)
+        n, dsor, z0, z1, r, q = (block + str(i) for i in range(6))
+        for i, name in enumerate((n, dsor, z0, z1, r, q)):
+            self._var_table.alias(name, block, i)
         """
-        _set_var(z, 0)_
-        _set_var(ddend, a)_
+        The temps n to q are consecutive cells of one block, as the loop below addresses them relative to n.
+        Each pass counts dsor down and r up; when dsor hits zero (tested with the z0 z1 pointer shift)
+        r is moved back into dsor and q is incremented.
+        _set_var(n, a)_
         _set_var(dsor, b)_
-        _set_var(q, 0)_
-        ddend[
-          _set_var(r, ddend)_
-          _set_var(end, 1)_
-          z[dsor-[end[-]]ddend-[end[-]]end]
-          dsor[r[-]]
-          r[q+z]
-          ddend
-        ]
+        z0[-]z1[-]r[-]q[-]
+        n[-dsor-r+z0+dsor[z0-]z0[-r[dsor+r-]q+z1]dsor n]
         _set_var(c, q)_
         _set_var(d, r)_
         """
-        self._zero_var(zero)
-        self._zero_var(q)
-        self.set_var([ddend, a])
+        self.set_var([n, a])
         self.set_var([dsor, b])
-        self._program += self._seek_to_var(ddend) + "["
-        self.set_var([r, ddend])
-        self.set_var([end, "1"])
-        self._program += self._seek_to_var(zero) + "[" + self._seek_to_var(dsor) + "-[" + self._seek_to_var(end) + "[-]]" + self._seek_to_var(ddend) + "-[" + self._seek_to_var(end) + "[-]]" + self._seek_to_var(end) + "]"
-        self._program += self._seek_to_var(dsor) + "[" + self._seek_to_var(r) + "[-]]"
-        self._program += self._seek_to_var(r) + "[" + self._seek_to_var(q) + "+" + self._seek_to_var(zero) + "]"
-        self._program += self._seek_to_var(ddend) + "]"
+        for var in (z0, z1, r, q):
+            self._zero_var(var)
+        self._tape.loop_start(self._cell(n))
+        self._tape.raw("->->>>+<<+<[>-]>[->>[-<<<+>>>]>+<<]<<<")
+        self._tape.clobber(self._cell(var) for var in (n, dsor, z0, z1, r, q))
+        self._tape.loop_end()
         self.set_var([c, q])
         self.set_var([d, r])
+        self._release(block)
 
     def div(self, args):
         assert 3 == len(args)
         a, b, c = args
-        self.div_mod([a, b, c, "__t1__"])
+        t1 = self._acquire([a, b, c])
+        self.div_mod([a, b, c, t1])
+        self._release(t1)
 
     def mod(self, args):
         assert 3 == len(args)
         a, b, c = args
-        self.div_mod([a, b, "__t1__", c])
+        t1 = self._acquire([a, b, c])
+        self.div_mod([a, b, t1, c])
+        self._release(t1)
+
+    def lset(self, args):
+        assert 3 == len(args)
+        a, b, c = args
+        literal = self._get_literal(b)
+        if literal is not None:
+            self.set_var([self._element(a, literal), c])
+            return
+        """
+        An indexed list is laid out as a header triple h then a triple (c_k, v_k, d_k) per element, where the
+        c and v cells are zero between instructions. The index and the value are carried to element b in one
+        walk from c_0, which leaves 1 in each c cell it passes as breadcrumbs for the walk back to h:
+        c_0 = b, v_0 = c
+        h>>>[-[->>>+<<<]>[->>>+<<<]<+>>>]  carry the rest of the index and the value one triple on
+        >>[-]<[->+<]                       d_b = v_b
+        <<<<[-<<<]                         clear the breadcrumbs back to h
+        A literal c is not carried: the walk carries the index only and adds c to the cleared d_b.
+        Carrying a number one triple on takes a loop pass per unit, so the walk is not constant per element:
+        it takes 14 + 10.5*b + 4.5*b*b + (5 + 9*b)*c steps (plus 2*d_b to clear the old data), quadratic in b.
+        """
+        self._check_indexed(a)
+        self.set_var([a + "[i]", b])
+        value = self._get_literal(c)
+        if value is not None:
+            # A literal is written at d_b rather than carried
+            code = ">>>[-[->>>+<<<]+>>>]>>[-]" + adds(value) + "<<<<<[-<<<]"
+        else:
+            self.set_var([a + "[v]", c])
+            code = ">>>[-[->>>+<<<]>[->>>+<<<]<+>>>]>>[-]<[->+<]<<<<[-<<<]"
+        self._tape.raw(code, self._cell(a + "[h]"))
+        self._clobber_list(a, data=True)
+
+    def lget(self, args):
+        assert 3 == len(args)
+        a, b, c = args
+        literal = self._get_literal(b)
+        if literal is not None:
+            self.set_var([c, self._element(a, literal)])
+            return
+        """
+        The index is carried to element b as in lset(), then d_b is copied to v_b and carried back to v_0:
+        c_0 = b
+        h>>>[-[->>>+<<<]+>>>]                 carry the rest of the index one triple on
+        >>[-<+<+>>]<<[->>+<<]                 v_b = d_b, restoring d_b through c_b
+        <<<[->>>>[-<<<+>>>]<<<<<<<]           clear the breadcrumbs back to h, carrying v back one triple each
+        c = v_0
+        This takes 14 + 16.5*b + 4.5*b*b + (15 + 9*b)*d_b steps, quadratic in b as for lset().
+        """
+        self._check_indexed(a)
+        self.set_var([a + "[i]", b])
+        self._tape.raw(">>>[-[->>>+<<<]+>>>]>>[-<+<+>>]<<[->>+<<]<<<[->>>>[-<<<+>>>]<<<<<<<]", self._cell(a + "[h]"))
+        self._clobber_list(a, data=False)
+        self._tape.clobber([self._cell(a + "[v]")])
+        self._zero_var(c)
+        self._loop(a + "[v]", [(c, 1)])
+
+    def _element(self, name, index):
+        # The alias of a list element's cell
+        size = self._indexed.get(name)
+        if size is None:
+            start, end = self.cells()[name]
+            size = end - start
+        if index >= size:
+            raise RuntimeError("Index {} out of range for list {} of size {}".format(index, name, size))
+        alias = "{}[{}]".format(name, index)
+        self._var_table.alias(alias, name, 5 + 3 * index if name in self._indexed else index)
+        return alias
+
+    def _check_indexed(self, name):
+        if name not in self._indexed:
+            raise RuntimeError("List {} is indexed by a variable but was not declared as indexed".format(name))
+
+    def _clobber_list(self, name, data):
+        # After a walk the carrier and value cells are zero; data cells are unknown if data
+        size = self._indexed[name]
+        self._tape.clobber(((name, offset) for offset in range(3 + 3 * size) if offset % 3 != 2), 0)
+        if data:
+            self._tape.clobber((name, 5 + 3 * k) for k in range(size))
+
+    def dispatch_start(self, segments):
+        """
+        Starts a dispatch loop, which runs segments in order with the shared code between each two of them,
+        while the shared code is emitted once:
+        loop[ flag_last[- segment_last loop-] ... flag_0[- segment_0 flag_1+ pending+] pending[- shared] ]
+        Emit the segments in reverse order, each between dispatch_segment_start() and dispatch_segment_end(),
+        then the shared code between dispatch_shared_start() and dispatch_shared_end(), then call dispatch_end().
+        """
+        flags = [self._acquire([]) for _ in range(segments)]
+        loop, pending = self._acquire(flags), self._acquire(flags)
+        for var in flags + [loop, pending]:
+            self._zero_var(var)
+        self._write_to_var(1, flags[0])
+        self._write_to_var(1, loop)
+        self._tape.loop_start(self._cell(loop))
+        self._dispatches.append((loop, pending, flags))
+
+    def dispatch_segment_start(self, index):
+        flag = self._dispatches[-1][2][index]
+        self._tape.loop_start(self._cell(flag))
+        self._tape.add(-1)
+
+    def dispatch_segment_end(self, index):
+        loop, pending, flags = self._dispatches[-1]
+        if index == len(flags) - 1:
+            self._tape.add(-1, self._cell(loop))
+        else:
+            self._tape.add(1, self._cell(flags[index + 1]))
+            self._tape.add(1, self._cell(pending))
+        self._tape.loop_end()
+
+    def dispatch_shared_start(self):
+        pending = self._dispatches[-1][1]
+        self._tape.loop_start(self._cell(pending))
+        self._tape.add(-1)
+
+    def dispatch_shared_end(self):
+        self._tape.loop_end()
+
+    def dispatch_end(self):
+        loop, pending, flags = self._dispatches.pop()
+        self._tape.loop_end()
+        self._release(loop, pending, *flags)
 
     @staticmethod
     def _get_literal(arg):
         literal = None
         if arg.startswith("'"):
-            literal = ord(arg[1:-1])
+            literal = ord(BrainfuckGenerator._unescape(arg[1:-1]))
         else:
             try:
                 literal = int(arg)
             except ValueError:
                 pass
-        if literal:
+        if literal is not None:
             literal &= 0xff
         return literal
+
+    @staticmethod
+    def _unescape(text):
+        return re.sub(r"\\(.)", lambda m: {"n": "\n", "r": "\r", "t": "\t"}.get(m.group(1), m.group(1)), text)
+
+
+@lru_cache(maxsize=4096)
+def _factored_form(delta, distance, detour, scratch_value, constants):
+    """
+    Finds count, factor and rest so that count*factor+rest == delta (mod 256) with the cheapest
+    scratch loop, by (size, steps) or (steps, size) depending on constants.
+    distance is between the cell and the scratch cell, detour is the extra travel to reach the scratch cell first.
+    Returns None if adding delta directly is at least as cheap.
+    """
+    linear = min(delta, 256 - delta)
+    best, best_cost = None, (linear, linear)
+    for count in range(2, 32):
+        setup = min((count - scratch_value) & 0xff, (scratch_value - count) & 0xff) if scratch_value is not None else 3 + count
+        for factor in range(-64, 65):
+            if factor in (-1, 0, 1):
+                continue
+            rest = (delta - count * factor) & 0xff
+            rest_len = min(rest, 256 - rest)
+            # set the scratch cell, loop of [ to cell, factor, to scratch, - ], back to cell and add the rest
+            size = detour + setup + 3 + 2 * distance + abs(factor) + distance + rest_len
+            steps = detour + setup + 1 + count * (2 * distance + abs(factor) + 2) + distance + rest_len
+            cost = (size, steps) if constants == CONSTANTS_SIZE else (steps, size)
+            if cost < best_cost:
+                best, best_cost = (count, factor, rest), cost
+    return best
@@ -1,89 +1,175 @@
 import io
 import re
-from typing import List, Generator, Iterator, Dict
-from dataclasses import dataclass, field
+import sys
+from typing import List, Generator, Iterator, Dict, Sequence, Union
+from dataclasses import dataclass
+
+
+_INSTRUCTION_WORDS = ("var", "set", "add", "sub", "inc", "dec", "mul", "divmod", "div", "mod", "cmp", "a2b", "b2a", "lset", "lget", "ifeq", "ifneq", "wneq", "proc", "call", "end", "read", "msg")
+_CHAR_ELEMENT_PATTERN = r"[^\'\"\\]|\\\\|\\\'|\\\"|\\n|\\r|\\t"
+_CHAR_PATTERN = fr"\'(?:{_CHAR_ELEMENT_PATTERN})\'"
+_STR_PATTERN = fr"\"(?:{_CHAR_ELEMENT_PATTERN})*\""
+_VAR_NAME_PATTERN = r"[$_a-zA-Z][$_a-zA-Z\d]*"
+_END_PATTERN = r"\s|--|#|//|$"
+
+_REM_RE = re.compile(r"rem(?:\s|$)", flags=re.IGNORECASE)
+_INSTR_RE = re.compile(fr"({'|'.join(_INSTRUCTION_WORDS)})(?={_END_PATTERN}|\")", flags=re.IGNORECASE)
+_ARG_RE = re.compile(
+    fr"(?P<str>{_STR_PATTERN})(?={_END_PATTERN}|\"|{_VAR_NAME_PATTERN})"
+    fr"|(?P<char>{_CHAR_PATTERN})(?={_END_PATTERN})"
+    fr"|(?P<num>-?\d+)(?={_END_PATTERN})"
+    fr"|(?P<var>{_VAR_NAME_PATTERN}(?:\s*\[\s*\d+\s*])?)(?={_END_PATTERN}|{_STR_PATTERN})")
+_COMMENT_RE = re.compile(r"#|//|--")
+_SPACE_RE = re.compile(r"\s*")
+
+
+class Tokens(list):
+    """
+    The [instr, arg0, arg1, ...] list of a line, with its line number.
+    """
+    __slots__ = ("line",)
+
+    def __init__(self, tokens: List[str], line: int):
+        super().__init__(tokens)
+        self.line = line
 
 
 def tokenize(code: io.TextIOBase) -> Generator[List[str], None, None]:
     """
     Reads the code as an io stream line by line.
     Skips/Ignores comments and whitespaces.
-    Returns an iterable of [instr, arg0, arg1, ...] lists.
+    Returns an iterable of [instr, arg0, arg1, ...] lists (Tokens, with the line number).
     Detects various syntax errors and raises RuntimeError on each.
     """
-    
-    instruction_words = ("var", "set", "add", "sub", "inc", "dec", "mul", "divmod", "div", "mod", "cmp", "a2b", "b2a", "lset", "lget", "ifeq", "ifneq", "wneq", "proc", "call", "end", "read", "msg")
-    instr_words_pattern = '|'.join(instruction_words)
-    char_element_pattern = r"[^\'\"\\]|\\\\|\\\'|\\\"|\\n|\\r|\\t"
-    char_pattern = fr"\'({char_element_pattern})\'"
-    str_pattern = fr"\"({char_element_pattern})*\""
-    var_name_pattern = r"[$_a-zA-Z][$_a-zA-Z\d]*"
-    
     for line_num, line in enumerate(code, start=1):
-        # Detect and skip empty lines and 'rem' comment lines
-        line = line.lstrip()
-        if not line or re.match(r"rem\s", line, flags=re.IGNORECASE):
+        # Detect and skip empty lines, comment lines and 'rem' comment lines
+        pos = _SPACE_RE.match(line).end()
+        if pos == len(line) or _COMMENT_RE.match(line, pos) or _REM_RE.match(line, pos):
             continue
 
         # Extract the instruction
-        m = re.match(fr"({instr_words_pattern})(\s|--|#|//|$)", line, flags=re.IGNORECASE)
+        m = _INSTR_RE.match(line, pos)
         if not m:
-            raise RuntimeError("Line {}: Invalid instruction or syntax \'{}\'".format(line_num, line))
-        instr = m.group(1).lower()
-        instr_and_args = [instr]
-        line = line[len(instr):].lstrip()
-
-        # Extract instruction args
-        while line and not re.match(r"#|//|--", line):
-            # Extract string
-            m = re.match(fr"({str_pattern})(\s|--|#|//|{var_name_pattern}|$)", line)
-            if m:
-                arg = m.group(1)
-                instr_and_args.append(arg)
-                line = line[len(arg):].lstrip()
-                continue
-            # Extract char
-            m = re.match(fr"({char_pattern})(\s|--|#|//|$)", line)
-            if m:
-                arg = m.group(1)
-                instr_and_args.append(arg)
-                line = line[len(arg):].lstrip()
-                continue
-            # Extract number
-            m = re.match(r"(-?\d+)(\s|--|#|//|$)", line)
-            if m:
-                arg = m.group(1)
-                instr_and_args.append(arg)
-                line = line[len(arg):].lstrip()
-                continue
-            # Extract variable
-            m = re.match(fr"({var_name_pattern}(\s*\[\s*\d+\s*])?)(\s|--|#|//|{str_pattern}|$)", line)
-            if m:
-                arg = m.group(1).lower()
-                instr_and_args.append(arg)
-                line = line[len(arg):].lstrip()
-                continue
-            # No matches above therefore error
-            raise RuntimeError("Line {}: Invalid args or syntax \'{}\'".format(line_num, line))
-        yield instr_and_args
+            raise RuntimeError("Line {}: Invalid instruction or syntax \'{}\'".format(line_num, line[pos:]))
+        instr_and_args = [m.group(1).lower()]
+        pos = _SPACE_RE.match(line, m.end()).end()
+
+        # Extract instruction args: strings, chars, numbers and variables
+        while pos < len(line) and not _COMMENT_RE.match(line, pos):
+            m = _ARG_RE.match(line, pos)
+            if not m:
+                raise RuntimeError("Line {}: Invalid args or syntax \'{}\'".format(line_num, line[pos:]))
+            arg = m.group()
+            instr_and_args.append(arg.lower() if m.lastgroup == "var" else arg)
+            pos = _SPACE_RE.match(line, m.end()).end()
+        yield Tokens(instr_and_args, line_num)
+
+
+# Kinds of instruction args
+ARG_VAR, ARG_LIST, ARG_CHAR, ARG_INT, ARG_STR = range(5)
+
+
+def arg_kind(arg: str) -> int:
+    """
+    Classifies a tokenized arg: a variable name, a list declaration ('name[size]'), a char, an int or a string literal.
+    """
+    c = arg[0]
+    if c == '"':
+        return ARG_STR
+    if c == "'":
+        return ARG_CHAR
+    if c == '-' or c.isdigit():
+        return ARG_INT
+    return ARG_LIST if '[' in arg else ARG_VAR
+
+
+# Shared kinds tuples, as there are few distinct ones
+_KINDS = {}
 
 
-@dataclass
 class Node:
-    instr: str
-    args: List[str]
-    parent: 'Node' = None
-    children: List['Node'] = field(default_factory=list)
+    """
+    An instruction with its args, the kinds of its args (ARG_*), its child nodes (the body of a block or
+    of an inlined call) and the source line it was parsed from (0 if unknown).
+    Nodes are slotted, args are interned tuples and leaves share an empty children tuple, as generated
+    programs have many nodes. Nodes that get children are created with a list.
+    """
+    __slots__ = ("instr", "_args", "kinds", "children", "line")
+
+    def __init__(self, instr: str, args: Sequence[str], children: Union[list, tuple] = (), line: int = 0):
+        self.instr = sys.intern(instr)
+        self.args = args
+        self.children = children
+        self.line = line
+
+    @property
+    def args(self) -> tuple:
+        return self._args
+
+    @args.setter
+    def args(self, args: Sequence[str]):
+        self._args = tuple(sys.intern(arg) for arg in args)
+        kinds = tuple(arg_kind(arg) for arg in self._args)
+        self.kinds = _KINDS.setdefault(kinds, kinds)
+
+    def copy(self) -> 'Node':
+        """
+        Returns a copy of the node, sharing the args, with an empty list of children if it has children.
+        """
+        node = Node.__new__(Node)
+        node.instr, node._args, node.kinds, node.line = self.instr, self._args, self.kinds, self.line
+        node.children = [] if self.children else ()
+        return node
+
+    def __repr__(self):
+        return "Node({!r}, {!r}, {!r})".format(self.instr, self.args, self.children)
+
+
+class Visitor:
+    """
+    Walks an AST in program order without recursion, calling visit_<instr>(node) for each node
+    (visit_root for the root, generic_visit if there is no such method).
+    A visit method returns what to walk next in place of the node's children: an iterable of nodes and
+    callables (which are called when reached), or None to skip the children.
+    """
+    def walk(self, ast: Node):
+        stack = [ast]
+        while stack:
+            node = stack.pop()
+            if callable(node):
+                node()
+                continue
+            visit = getattr(self, "visit_" + (node.instr or "root"), self.generic_visit)
+            following = visit(node)
+            if following:
+                stack.extend(reversed(list(following)))
+
+    def generic_visit(self, node: Node):
+        return node.children
+
+
+def walk(ast: Node) -> Iterator[Node]:
+    """
+    Yields the nodes of the AST in program order, without recursion.
+    A node's children are read after it is yielded, so they can be replaced then.
+    """
+    stack = [ast]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(reversed(node.children))
 
 
 class VarTable:
     def __init__(self, start_index=0):
         self._ctr = start_index
         self.vars = dict()
+        self.sizes = dict()
         self._temp_var_index = 0
 
     def add(self, varname, size=1):
         self.vars[varname] = self._ctr
+        self.sizes[varname] = size
         self._ctr += size
 
     def push_temp(self) -> str:
@@ -122,52 +208,100 @@ def parse(instrs_and_args: Iterator[List[str]], root=None, var_table: VarTable =
     Variables are added to the provided VarTable (and not to the AST).
     Procedure definitions are added to the provided proc_table, with each procedure being parsed as an AST.
     Returns the root of the AST.
+    Open blocks are kept on a stack rather than recursion, so nesting depth is not limited.
     """
     if not root:
-        root = Node("", [])
+        root = Node("", [], [])
 
-    parent = root
+    blocks = [root]
+    proc = None  # (name, args, blocks to return to) of the procedure being defined
     for instr_and_args in instrs_and_args:
         instr = instr_and_args[0]
         args = instr_and_args[1:]
+        line = getattr(instr_and_args, "line", 0)
 
         if instr == "end":
-            if parent.instr == "proc":
-                return root
-            parent = parent.parent
+            if blocks[-1].instr == "proc":
+                name, proc_args, blocks_after = proc
+                proc_table[name] = Procedure(name, proc_args, blocks[-1])
+                blocks, proc = blocks_after, None
+                continue
+            if len(blocks) == 1:
+                raise RuntimeError("'end' without a block or procedure to close")
+            blocks.pop()
             continue
 
         if instr == 'proc':
-            proc_table[args[0]] = Procedure(args[0], args[1:], parse(instrs_and_args, root=Node("proc", [])))
+            if proc:
+                raise RuntimeError("Procedure '{}' defined inside procedure '{}'".format(args[0], proc[0]))
+            proc = (args[0], args[1:], blocks)
+            blocks = [Node("proc", [], [])]
             continue
 
         if instr == 'var':
+            if proc:
+                raise RuntimeError("Variables defined inside procedure '{}'".format(proc[0]))
             var_table.add_from_args(args)
             continue
 
-        node = Node(instr, args, parent=parent)
-        parent.children.append(node)
         if instr == "ifeq" or instr == "ifneq" or instr == "wneq":
-            parent = node
+            node = Node(instr, args, [], line)
+            blocks[-1].children.append(node)
+            blocks.append(node)
+        else:
+            blocks[-1].children.append(Node(instr, args, (), line))
+
+    if proc:
+        # A procedure left open at the end of the code ends there
+        name, proc_args, _ = proc
+        proc_table[name] = Procedure(name, proc_args, blocks[0])
     return root
 
 
 def inline(ast: Node, proc_table: Dict[str, Procedure], replace_vars: Dict[str, str] = None):
     """
-    Replaces all 'call <proc_name> <args>*' instances in the AST with the corresponding procedure's AST.
-    """
-    if replace_vars:
-        for i in range(len(ast.args)):
-            arg = ast.args[i]
-            if arg in replace_vars:
-                ast.args[i] = replace_vars[arg]
-    if ast.instr == 'call':
-        proc = proc_table[ast.args[0]]
-        for child in proc.ast.children:
-            ast.children.append(child)
-            child.parent = ast
-            inline(child, proc_table, replace_vars={key: val for key, val in zip(proc.args, ast.args[1:])})
-        return
-    for child in ast.children:
-        inline(child, proc_table, replace_vars=replace_vars)
-    return
+    Replaces all 'call <proc_name> <args>*' instances in the AST with the corresponding procedure's AST:
+    each call node gets a fresh copy of the procedure's body as its children, with the procedure's
+    parameters replaced by the call's args. The procedures' stored ASTs are not modified.
+    Walks the AST with an explicit stack, so nesting depth and call chain length are not limited.
+    Raises RuntimeError on calls to unknown procedures, wrong numbers of args and recursive calls.
+    """
+    active = set()  # procedures on the current call chain
+    stack = [(ast, replace_vars or {})]
+    while stack:
+        entry = stack.pop()
+        if isinstance(entry, str):
+            # End of the call to this procedure
+            active.remove(entry)
+            continue
+
+        node, replace_vars = entry
+        if replace_vars and any(arg in replace_vars for arg in node.args):
+            node.args = [replace_vars.get(arg, arg) for arg in node.args]
+        if node.instr == 'call':
+            name = node.args[0]
+            if name not in proc_table:
+                raise RuntimeError("Call to undefined procedure '{}'".format(name))
+            if name in active:
+                raise RuntimeError("Recursive call to procedure '{}'".format(name))
+            proc = proc_table[name]
+            if len(proc.args) != len(node.args) - 1:
+                raise RuntimeError("Procedure '{}' takes {} args but is called with {}".format(name, len(proc.args), len(node.args) - 1))
+            active.add(name)
+            stack.append(name)
+            node.children = [_copy(child) for child in proc.ast.children]
+            replace_vars = dict(zip(proc.args, node.args[1:]))
+        stack.extend((child, replace_vars) for child in reversed(node.children))
+
+
+def _copy(ast: Node) -> Node:
+    # Copies the subtree (without recursion)
+    root = ast.copy()
+    stack = [(ast, root)]
+    while stack:
+        src, dst = stack.pop()
+        for child in src.children:
+            copy = child.copy()
+            dst.children.append(copy)
+            stack.append((child, copy))
+    return root
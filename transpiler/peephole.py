@@ -0,0 +1,218 @@
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Tuple
+
+
+@dataclass
+class PeepholeStats:
+    """
+    chars_saved: how much shorter the optimized code is.
+    steps_saved: steps saved per run by the code outside of loops (including loops that were removed
+    or replaced); savings inside loops that remain depend on the input, so this is a lower bound.
+    """
+    chars_saved: int = 0
+    steps_saved: int = 0
+    dead_loops_removed: int = 0
+    clears_folded: int = 0
+
+
+class _CellState:
+    """
+    What is known about the cells, relative to an anchor cell.
+    Before the first loop with unknown pointer movement the anchor is cell 0 and all untouched cells are zero.
+    """
+    def __init__(self, all_zero=True):
+        self.ptr = 0
+        self.known = {}
+        self.all_zero = all_zero
+
+    def value(self, offset=None):
+        offset = self.ptr if offset is None else offset
+        if offset in self.known:
+            return self.known[offset]
+        return 0 if self.all_zero else None
+
+    def set(self, value, offset=None):
+        self.known[self.ptr if offset is None else offset] = value
+
+    def reset(self):
+        # The pointer position is lost; only the current cell is known to be zero (a loop just ended)
+        self.ptr = 0
+        self.known = {0: 0}
+        self.all_zero = False
+
+
+def peephole(bf: str) -> Tuple[str, PeepholeStats]:
+    """
+    Simplifies generated brainfuck code:
+    - folds runs of '+'/'-' and '<'/'>' (cancelling pairs) into their shortest form,
+    - removes loops that can never run because their cell is known to be zero, such as a '[-]'
+      right after another loop or on a cell that was never written,
+    - replaces '[-]' on a cell of known value with the shorter delta,
+    - drops trailing cell updates and pointer moves, which have no observable effect.
+    Assumes the code never moves the pointer left of cell 0, which holds for generated code.
+    Returns the optimized code and what was saved.
+    """
+    stats = PeepholeStats()
+    return "".join(peephole_chunks((bf,), stats)), stats
+
+
+def peephole_chunks(pieces: Iterable[str], stats: PeepholeStats = None) -> Iterator[str]:
+    """
+    Simplifies the code given in pieces like peephole(), yielding the optimized code in pieces as soon as the
+    code after it can no longer change it, so the whole program is never held as one string.
+    If given, stats is filled in by the time the pieces are exhausted.
+    """
+    stats = PeepholeStats() if stats is None else stats
+    state, out = _CellState(), []
+    for length, items in _parse_pieces(pieces):
+        stats.chars_saved += length
+        for item in items:
+            stats.steps_saved += _count_outside_loops([item])
+            _optimize_item(item, state, 0, stats, out)
+        # A trailing run of cell updates and pointer moves may still be merged, or dropped at the end
+        end = len(out)
+        while end and out[end - 1][0] in "+>":
+            end -= 1
+        if end:
+            done = out[:end]
+            del out[:end]
+            code = _render(done)
+            stats.chars_saved -= len(code)
+            stats.steps_saved -= _count_outside_loops(done)
+            yield code
+
+
+def _parse_pieces(pieces: Iterable[str]) -> Iterator[Tuple[int, list]]:
+    # Builds the tree of ('+', n), ('>', n), ('.',), (',',) and ('[', body) items, folding runs, piece by piece.
+    # Yields the length of each piece and the top-level items the code after them cannot merge into, then the
+    # items left at the end
+    stack = [[]]
+    for piece in pieces:
+        for c in piece:
+            block = stack[-1]
+            if c == "+" or c == "-":
+                _append(block, ("+", 1 if c == "+" else 255))
+            elif c == ">" or c == "<":
+                _append(block, (">", 1 if c == ">" else -1))
+            elif c == "[":
+                stack.append([])
+            elif c == "]":
+                if len(stack) == 1:
+                    raise RuntimeError("Unmatched ']' in brainfuck code")
+                body = stack.pop()
+                stack[-1].append(("[", body))
+            elif c == "." or c == ",":
+                block.append((c,))
+        top = stack[0]
+        end = len(top)
+        while end and top[end - 1][0] in "+>":
+            end -= 1
+        yield len(piece), top[:end]
+        del top[:end]
+    if len(stack) != 1:
+        raise RuntimeError("Unmatched '[' in brainfuck code")
+    yield 0, stack[0]
+
+
+def _append(block: list, item: tuple):
+    # Appends the item, merging it into a preceding item of the same kind
+    if block and block[-1][0] == item[0] and item[0] in "+>":
+        op, n = block.pop()
+        n = (n + item[1]) % 256 if op == "+" else n + item[1]
+        if n:
+            block.append((op, n))
+        return
+    if item[0] in "+>" and not item[1]:
+        return
+    block.append(item)
+
+
+def _optimize_block(block: list, state: _CellState, depth: int, stats: PeepholeStats) -> list:
+    out = []
+    for item in block:
+        _optimize_item(item, state, depth, stats, out)
+    return out
+
+
+def _optimize_item(item: tuple, state: _CellState, depth: int, stats: PeepholeStats, out: list):
+    op = item[0]
+
+    if op == "+":
+        value = state.value()
+        state.set(None if value is None else (value + item[1]) % 256)
+        _append(out, item)
+    elif op == ">":
+        state.ptr += item[1]
+        _append(out, item)
+    elif op == ",":
+        state.set(None)
+        out.append(item)
+    elif op == ".":
+        out.append(item)
+    else:
+        body = item[1]
+        value = state.value()
+
+        if value == 0:
+            # The loop can never run
+            stats.dead_loops_removed += 1
+            if depth == 0:
+                stats.steps_saved += 1
+            return
+
+        if value is not None and len(body) == 1 and body[0][0] == "+" and body[0][1] in (1, 255):
+            # A clear loop on a known value
+            iterations = value if body[0][1] == 255 else 256 - value
+            stats.clears_folded += 1
+            if depth == 0:
+                stats.steps_saved += 1 + 2 * iterations
+            _append(out, ("+", (256 - value) % 256))
+            state.set(0)
+            return
+
+        new_body = _optimize_block(body, _CellState(all_zero=False), depth + 1, stats)
+        out.append(("[", new_body))
+
+        balanced, written = _effects(new_body)
+        if balanced:
+            for offset in written:
+                state.set(None, state.ptr + offset)
+            state.set(0)
+        else:
+            state.reset()
+
+
+def _effects(block: list) -> Tuple[bool, set]:
+    # Returns whether the block ends where it started, and the offsets of the cells it may write
+    ptr, written = 0, set()
+    for item in block:
+        op = item[0]
+        if op == ">":
+            ptr += item[1]
+        elif op == "+" or op == ",":
+            written.add(ptr)
+        elif op == "[":
+            balanced, body_written = _effects(item[1])
+            if not balanced:
+                return False, written
+            written.update(ptr + offset for offset in body_written)
+    return ptr == 0, written
+
+
+def _count_outside_loops(block: list) -> int:
+    return sum(len(_render([item])) for item in block if item[0] != "[")
+
+
+def _render(block: List[tuple]) -> str:
+    parts = []
+    for item in block:
+        op = item[0]
+        if op == "+":
+            parts.append("+" * item[1] if item[1] <= 128 else "-" * (256 - item[1]))
+        elif op == ">":
+            parts.append(">" * item[1] if item[1] > 0 else "<" * -item[1])
+        elif op == "[":
+            parts.append("[" + _render(item[1]) + "]")
+        else:
+            parts.append(op)
+    return "".join(parts)
@@ -0,0 +1,64 @@
+import bisect
+from dataclasses import dataclass
+from typing import List, Tuple
+
+from bfinterpreter.profiler import Profile, profile
+from transpiler.old import CONSTANTS_SIZE
+from transpiler.dedup import DEDUP_OFF
+from transpiler.transpiler import transpile
+
+
+@dataclass
+class LineProfile:
+    """
+    The steps spent in the code of one source line (line 0 for code without a line), their share of
+    all steps, and the most passes one of its loops made in a single entry.
+    """
+    line: int
+    source: str
+    steps: int
+    percent: float
+    max_iterations: int
+
+
+def profile_source(code: str, instream=None, outstream=None, constants: str = CONSTANTS_SIZE, layout: bool = True,
+                   dedup: str = DEDUP_OFF, max_steps: int = None, timeout: float = None) -> List[LineProfile]:
+    """
+    Transpiles the code without the peephole pass, runs it with the profiler and returns the steps by
+    source line, most steps first (see profile_lines()).
+    """
+    report = {}
+    bf = transpile(code, optimize=False, constants=constants, layout=layout, dedup=dedup, report=report)
+    return profile_lines(profile(bf, instream, outstream, max_steps=max_steps, timeout=timeout), report["source_map"], code)
+
+
+def profile_lines(run: Profile, spans: List[Tuple[int, int, int]], code: str) -> List[LineProfile]:
+    """
+    Rolls the counts of a profiled run up to the source lines of the spans of its code
+    (see BrainfuckGenerator.source_map()). Returns the lines that ran, most steps first.
+    """
+    steps, iterations = {}, {}
+    for start, end, line in spans:
+        steps[line] = steps.get(line, 0) + sum(run.counts[start:end])
+    starts = [span[0] for span in spans]
+    for position, stats in run.loops.items():
+        line = spans[bisect.bisect_right(starts, position) - 1][2]
+        iterations[line] = max(iterations.get(line, 0), stats.max_iterations)
+
+    sources = code.split("\n")
+    total = run.num_steps or 1
+    lines = [LineProfile(line, sources[line - 1].strip() if 0 < line <= len(sources) else "", count,
+                         100.0 * count / total, iterations.get(line, 0))
+             for line, count in steps.items() if count]
+    return sorted(lines, key=lambda line: (-line.steps, line.line))
+
+
+def format_report(lines: List[LineProfile]) -> str:
+    """
+    Formats the profile of the lines as a table.
+    """
+    rows = ["{:>6} {:>12} {:>7} {:>10}  {}".format("line", "steps", "%", "max iter", "source")]
+    for line in lines:
+        rows.append("{:>6} {:>12} {:>6.1f}% {:>10}  {}".format(line.line or "-", line.steps, line.percent,
+                                                               line.max_iterations, line.source))
+    return "\n".join(rows)
@@ -1,42 +1,293 @@
+import functools
+import hashlib
 from io import StringIO
+from typing import Optional, Set, TextIO, Tuple
 
 from transpiler.parser import *
+from transpiler.ir import Loop, Op, write_chunks
+from transpiler.old import BrainfuckGenerator, Var, CONSTANTS_SIZE
+from transpiler.cache import TranspileCache, FragmentCache, FragmentStats, Fragment
+from transpiler.peephole import peephole, peephole_chunks, PeepholeStats
+from transpiler.layout import plan_layout
+from transpiler.dedup import dedup_calls, DEDUP_OFF
 
 
-def print_ast(ast: Node):
-    #print("{} {}".format(ast.instr, ' '.join(ast.args)))
-    #for child in ast.children:
-    #    print_ast(child)
-    print(create_intermediate_bf(ast))
+def print_ast(ast: Node, var_table: VarTable):
+    for op in create_intermediate_bf(ast, var_table):
+        print(op)
 
 
-def create_intermediate_bf(ast: Node, var_table: VarTable) -> [str]:
-    def visit(code: [str], node: Node, var_table):
-        new_code = []
-        for child in node.children:
-            new_code += visit(code, child, var_table)
-        return codify(new_code, node, var_table)
+def create_intermediate_bf(ast: Node, var_table: VarTable, constants: str = CONSTANTS_SIZE) -> List[Op]:
+    """
+    Lowers an inlined AST to the typed IR (see transpiler.ir), with the cells named by variable and offset.
+    """
+    return _generate(ast, var_table, constants).ir()
 
-    def codify(code: [str], node: Node, var_table: VarTable):
-        if node.instr == "call" or node.instr == '':
-            return code
-        if node.instr == "ifeq" or node.instr == "ifneq" or node.instr == "wneq":
-            return [node.instr, *node.args, '['] + code + [']']
-        return code + [node.instr, *node.args]
 
-    return visit([], ast)
+# Instructions the BrainfuckGenerator can emit, by generator method name
+_GENERATOR_METHODS = {
+    "read": "read_input",
+    "msg": "print_output",
+    "set": "set_var",
+    "inc": "inc_var",
+    "dec": "dec_var",
+    "add": "add",
+    "sub": "sub",
+    "mul": "mul",
+    "divmod": "div_mod",
+    "div": "div",
+    "mod": "mod",
+    "lset": "lset",
+    "lget": "lget",
+}
 
 
-def transpile(code: str) -> str:
+def generate_bf(ast: Node, var_table: VarTable, constants: str = CONSTANTS_SIZE, layout: Dict[str, int] = None) -> str:
+    """
+    Generates the brainfuck code for an inlined AST, with the variables of var_table declared in order.
+    constants is the strategy for emitting literals, layout the optional {name: start cell} of the temps
+    and variables (see BrainfuckGenerator).
+    Raises RuntimeError on instructions the generator does not support yet.
+    """
+    return _generate(ast, var_table, constants, layout).get_program()
+
+
+def _generate(ast: Node, var_table: VarTable, constants: str, layout: Dict[str, int] = None,
+              fragments: FragmentCache = None, statements: List[tuple] = None) -> BrainfuckGenerator:
+    generator = BrainfuckGenerator(constants, layout)
+    if var_table.vars:
+        indexed = _indexed_lists(ast)
+        generator.declare_vars([Var(name, var_table.sizes[name], name in indexed) for name in var_table.vars])
+    visitor = _GeneratorVisitor(generator)
+    if fragments is None:
+        visitor.walk(ast)
+        return generator
+
+    # Each top-level instruction generated before from the same state is replayed, moved to its current lines
+    for node, key, lines in statements:
+        key = (constants, key, generator.state())
+        fragment = fragments.get(key)
+        if fragment is None:
+            start = len(generator.ir())
+            visitor.walk(node)
+            fragments.put(key, Fragment(generator.ir()[start:], lines, generator.state()))
+            fragments.stats.generated += 1
+        else:
+            ops = fragment.ops if fragment.lines == lines else _move_lines(fragment.ops, dict(zip(fragment.lines, lines)))
+            generator.replay(ops, fragment.state)
+            fragments.stats.reused += 1
+    return generator
+
+
+def _move_lines(ops: List[Op], lines: Dict[int, int]) -> List[Op]:
+    # The ops with their source lines mapped (line is the last field of each op)
+    return [Loop(op.cell, _move_lines(op.body, lines), lines[op.line]) if type(op) is Loop
+            else type(op)(*op[:-1], lines[op.line]) for op in ops]
+
+
+def _statements(ast: Node, proc_table: Dict[str, Procedure]) -> List[tuple]:
+    """
+    Returns the top-level instructions of an inlined AST as (node, key, lines): key fingerprints the instruction
+    without its source lines, a call by its args and the fingerprint of its procedure, and lines are the source
+    lines of the instruction's nodes in walk order.
+    """
+    procedures = {}
+    statements = []
+    for node in ast.children:
+        if node.instr == "call":
+            fingerprint, lines = _procedure_key(node.args[0], proc_table, procedures)
+            statements.append((node, ("call", node.args, fingerprint), (node.line,) + lines))
+        else:
+            nodes = list(walk(node))
+            statements.append((node, tuple((n.instr, n.args, len(n.children)) for n in nodes), tuple(n.line for n in nodes)))
+    return statements
+
+
+def _procedure_key(name: str, proc_table: Dict[str, Procedure], procedures: Dict[str, tuple]) -> tuple:
+    """
+    Returns (fingerprint, lines) of the body of a procedure as inline() expands it: a digest of its params and
+    nodes, with those of the procedures it calls, and the source lines of the expanded nodes in walk order.
+    Computed callees first without recursion, and kept in procedures.
+    """
+    stack = [name]
+    while stack:
+        current = stack[-1]
+        if current in procedures:
+            stack.pop()
+            continue
+        proc = proc_table[current]
+        body = [node for child in proc.ast.children for node in walk(child)]
+        pending = [node.args[0] for node in body if node.instr == "call" and node.args[0] not in procedures]
+        if pending:
+            stack.extend(pending)
+            continue
+        stack.pop()
+        digest = hashlib.sha256(repr(proc.args).encode())
+        lines = []
+        for node in body:
+            digest.update(repr((node.instr, node.args, len(node.children))).encode())
+            lines.append(node.line)
+            if node.instr == "call":
+                digest.update(procedures[node.args[0]][0].encode())
+                lines += procedures[node.args[0]][1]
+        procedures[current] = (digest.hexdigest(), tuple(lines))
+    return procedures[name]
+
+
+def _indexed_lists(ast: Node) -> Set[str]:
+    # The lists that lset or lget index by a variable rather than a literal
+    return {node.args[0] for node in walk(ast)
+            if node.instr in ("lset", "lget") and node.kinds[1] == ARG_VAR}
+
+
+class _GeneratorVisitor(Visitor):
+    """
+    Emits each instruction of an inlined AST with the generator.
+    """
+    def __init__(self, generator: BrainfuckGenerator):
+        self.generator = generator
+
+    def visit_root(self, node: Node):
+        return node.children
+
+    visit_call = visit_segment = visit_root
+
+    def visit_dispatch(self, node: Node):
+        # The segments in reverse order, each under its flag, then the shared call
+        generator = self.generator
+        segments, shared = node.children[:-1], node.children[-1]
+        generator.source(node.line)
+        generator.dispatch_start(len(segments))
+        step = functools.partial(self._dispatch_step, node.line)
+        following = []
+        for i in reversed(range(len(segments))):
+            following += [functools.partial(step, generator.dispatch_segment_start, i), segments[i],
+                          functools.partial(step, generator.dispatch_segment_end, i)]
+        return following + [functools.partial(step, generator.dispatch_shared_start), shared,
+                            functools.partial(step, generator.dispatch_shared_end), functools.partial(step, generator.dispatch_end)]
+
+    def _dispatch_step(self, line, method, *args):
+        # The dispatch loop's own code belongs to the line of the call
+        self.generator.source(line)
+        method(*args)
+
+    def generic_visit(self, node: Node):
+        if node.instr not in _GENERATOR_METHODS:
+            raise RuntimeError("Instruction '{}' is not supported by the code generator".format(node.instr))
+        self.generator.source(node.line)
+        getattr(self.generator, _GENERATOR_METHODS[node.instr])(list(node.args))
+
+
+def transpile(code: str, cache: TranspileCache = None, optimize: bool = True, constants: str = CONSTANTS_SIZE,
+              layout: bool = True, dedup: str = DEDUP_OFF, report: dict = None, fragments: FragmentCache = None) -> str:
+    """
+    Transpiles the code to brainfuck.
+    With a cache, unchanged sources (for the same transpiler version and options) are returned from the cache.
+    With fragments, the code is transpiled incrementally: the top-level instructions generated by an earlier
+    transpile with the same fragments (and unchanged since) are not generated again (see FragmentCache).
+    optimize runs the peephole pass over the generated code.
+    constants is the strategy for emitting literals: CONSTANTS_LINEAR, CONSTANTS_SIZE or CONSTANTS_STEPS.
+    layout reorders the cells to minimise pointer travel (see plan_layout()).
+    dedup emits repeated identical calls once in a dispatch loop: DEDUP_OFF, DEDUP_AUTO or DEDUP_ALWAYS
+    (see dedup_calls()), trading runtime steps for size.
+    If a report dict is given, the pipeline stages add their statistics to it (report["dedup"],
+    report["layout"], report["peephole"], report["fragments"]); nothing is added when the result comes from the cache.
+    Without optimize, report["source_map"] also gets the [(start, end, source line)] spans of the code
+    (the peephole pass does not keep spans).
+    """
+    if cache is None:
+        return _transpile(code, optimize, constants, layout, dedup, report, fragments)
+
+    key = cache.key(code, optimize=optimize, constants=constants, layout=layout, dedup=dedup)
+    bf = cache.get(key)
+    if bf is None:
+        bf = _transpile(code, optimize, constants, layout, dedup, report, fragments)
+        cache.put(key, bf)
+    return bf
+
+
+def transpile_stream(source: TextIO, outstream: TextIO, optimize: bool = True, constants: str = CONSTANTS_SIZE,
+                     layout: bool = True, dedup: str = DEDUP_OFF, report: dict = None, fragments: FragmentCache = None):
+    """
+    Transpiles the code read line by line from the text stream source and writes the brainfuck to outstream,
+    with the options of transpile().
+    The code is written as it is emitted, and with optimize as the peephole pass gets through it, without
+    building it as one string.
+    """
+    _, generator = lower(source, constants, layout, dedup, report, fragments)
+    if optimize:
+        stats = PeepholeStats()
+        write_chunks(peephole_chunks(generator.chunks(), stats), outstream)
+        if report is not None:
+            report["peephole"] = stats
+    else:
+        generator.write_to(outstream)
+
+
+def _transpile(code: str, optimize: bool, constants: str, layout: bool, dedup: str, report: dict,
+               fragments: FragmentCache) -> str:
+    _, generator = lower(StringIO(code), constants, layout, dedup, report, fragments)
+    bf = generator.get_program()
+    if report is not None and not optimize:
+        report["source_map"] = generator.source_map()
+    if optimize:
+        bf = _optimize(bf, report)
+    return bf
+
+
+def lower(source: TextIO, constants: str = CONSTANTS_SIZE, layout: bool = True, dedup: str = DEDUP_OFF,
+          report: dict = None, fragments: FragmentCache = None) -> Tuple[Node, BrainfuckGenerator]:
+    """
+    Parses the code read from the text stream source and generates it, with the options of transpile().
+    Returns the AST after inline() and dedup_calls(), and the generator holding the program's IR.
+    """
     var_table = VarTable()
     proc_table = {}
-    ast = parse(tokenize(StringIO(code)), var_table=var_table, proc_table=proc_table)
+    ast = parse(tokenize(source), var_table=var_table, proc_table=proc_table)
     inline(ast, proc_table)
+    decisions = dedup_calls(ast, dedup)
+    if report is not None and dedup != DEDUP_OFF:
+        report["dedup"] = decisions
+    statements = None
+    if fragments is not None:
+        statements = _statements(ast, proc_table)
+        fragments.stats = FragmentStats()
+        if report is not None:
+            report["fragments"] = fragments.stats
+
+    def generate(cells):
+        return _generate(ast, var_table, constants, cells, fragments, statements)
+
+    if not layout:
+        return ast, generate(None)
+    if fragments is not None and fragments.layout is not None:
+        generator = _kept_layout(generate, fragments.layout)
+        if generator is not None:
+            fragments.stats.layout_kept = True
+            return ast, generator
+    generator, stats = plan_layout(generate)
+    if report is not None:
+        report["layout"] = stats
+    if fragments is not None:
+        fragments.layout = {name: start for name, (start, _) in generator.cells().items()}
+    return ast, generator
+
 
-    print("Var Table:")
-    for k, v in var_table.vars.items():
-        print("{} {}".format(k, v))
-    print()
+def _kept_layout(generate, layout: Dict[str, int]) -> Optional[BrainfuckGenerator]:
+    # The program generated with the layout planned before, if its cells are still those laid out
+    try:
+        generator = generate(layout)
+    except RuntimeError:
+        # The cells no longer fit the layout (errors in the program are raised again when it is planned)
+        return None
+    cells = generator.cells()
+    if cells.keys() != layout.keys() or any(cells[name][0] != start for name, start in layout.items()):
+        return None
+    return generator
 
-    print_ast(ast)
 
+def _optimize(bf: str, report: dict) -> str:
+    bf, stats = peephole(bf)
+    if report is not None:
+        report["peephole"] = stats
+    return bf